@@ -1,31 +1,117 @@
 # app/api.py
 # This file defines the FastAPI routes for the application.
 # Author: Yassine Amounane
+import asyncio
+import hashlib
 import shutil
 import os
+import re
 import tempfile
 import logging
-from app.rag_service import rag_query, summarize_repository_analyses
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from app.rag_service import rag_query, rag_query_batch, batch_similarity_search, build_query_filter, summarize_repository_analyses
+from fastapi import APIRouter, HTTPException, Request
 from app.utils.file_validation import validate_file
-from app.document import add_documents_to_index, add_texts_to_qdrant
+from app.utils.upload_stream import receive_upload, UploadRejected
+from app.document import add_documents_to_index, add_texts_to_qdrant, is_file_indexed
 from pydantic import BaseModel
-from app.core import get_vectorstore, delete_qdrant_collection, QDRANT_COLLECTION_NAME
-from typing import Optional
-from app.utils.repo_utils import clone_repository, process_repository_files
+from app.core import (
+    delete_qdrant_collection,
+    readiness,
+    warm_up,
+    is_warming_up,
+    resolve_collection_name,
+    collection_key,
+    list_routed_collections,
+    CollectionNotFoundError,
+    QDRANT_COLLECTION_NAME
+)
+from app.utils.dedup import reset_signature_index
+from app.settings import QUERY_BATCH_MAX_QUESTIONS, QUERY_FANOUT_MAX_COLLECTIONS, QDRANT_COLLECTION_PER_REPO, SNAPSHOT_DIR
+from app.snapshot import (
+    export_collection,
+    import_collection,
+    create_qdrant_snapshot,
+    list_qdrant_snapshots,
+    recover_qdrant_snapshot,
+    SnapshotNotFoundError
+)
+from typing import List, Optional
+from app.utils.repo_utils import clone_repository, process_repository_files, index_repository_source
 from fastapi.responses import JSONResponse
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-class QueryRequest(BaseModel):
+def resolve_collection(key: Optional[str]) -> str:
+    try:
+        return resolve_collection_name(key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class QueryScope(BaseModel):
+    # Routing: "collection" searches one tenant/repo collection, "collections" fans out
+    # across several. Neither searches the default collection.
+    collection: Optional[str] = None
+    collections: Optional[List[str]] = None
+    repo_name: Optional[str] = None
+    file_path: Optional[str] = None
+    symbol: Optional[str] = None
+    code_only: bool = False
+
+    def to_filter(self):
+        return build_query_filter(self.repo_name, self.file_path, self.symbol, self.code_only)
+
+    def collection_names(self) -> List[str]:
+        if self.collection and self.collections:
+            raise HTTPException(status_code=400, detail="Send either 'collection' or 'collections', not both")
+        keys = self.collections or [self.collection]
+        if len(keys) > QUERY_FANOUT_MAX_COLLECTIONS:
+            raise HTTPException(status_code=400, detail=f"Too many collections: {len(keys)} (max {QUERY_FANOUT_MAX_COLLECTIONS})")
+        return list(dict.fromkeys(resolve_collection(key) for key in keys))
+
+class QueryRequest(QueryScope):
     question: str
     k: int = 100
 
+class BatchQueryRequest(QueryScope):
+    questions: List[str]
+    k: int = 100
+
 class GitIngestRequest(BaseModel):
     repo_url: str
     branch: Optional[str] = "main"
+    collection: Optional[str] = None
+
+class ExportRequest(BaseModel):
+    name: str
+    quantize: bool = False
+    collection: Optional[str] = None
+
+class ImportRequest(BaseModel):
+    name: str
+    recreate: bool = False
+    collection: Optional[str] = None
+
+class RecoverSnapshotRequest(BaseModel):
+    name: str
+    collection: Optional[str] = None
+
+def repo_collection_key(repo_name: str) -> str:
+    """
+    Routing key of a repository's own collection: the name with unsupported
+    characters replaced, plus a short hash of the original name so that
+    e.g. "a.b" and "a-b" do not share a collection.
+    """
+    digest = hashlib.sha256(repo_name.encode("utf-8")).hexdigest()[:8]
+    return f"{re.sub(r'[^A-Za-z0-9_-]', '-', repo_name)[:55]}-{digest}"
+
+SNAPSHOT_NAME_PATTERN = re.compile(r"^[\w.-]+$")
+
+def resolve_snapshot_path(name: str) -> str:
+    if not SNAPSHOT_NAME_PATTERN.match(name) or name in (".", ".."):
+        raise HTTPException(status_code=400, detail=f"Invalid snapshot name: {name}")
+    return os.path.join(SNAPSHOT_DIR, name)
 
 async def ingest_repository(request: GitIngestRequest):
     logger.info(f"Starting ingestion for {request.repo_url}, branch {request.branch}")
@@ -39,6 +125,13 @@ async def ingest_repository(request: GitIngestRequest):
     else:
         repo_name = repo_name_full
 
+    if request.collection:
+        collection_name = resolve_collection(request.collection)
+    elif QDRANT_COLLECTION_PER_REPO:
+        collection_name = resolve_collection(repo_collection_key(repo_name))
+    else:
+        collection_name = QDRANT_COLLECTION_NAME
+
     try:
         temp_dir = tempfile.mkdtemp()
         logger.info(f"Created temporary directory for {repo_name}: {temp_dir}")
@@ -46,7 +139,9 @@ async def ingest_repository(request: GitIngestRequest):
         if not clone_repository(repo_url, branch, temp_dir):
             raise HTTPException(status_code=500, detail=f"Failed to clone repository: {repo_name}")
 
-        file_analyses = process_repository_files(temp_dir, repo_name)
+        file_analyses = process_repository_files(temp_dir, repo_name, collection_name=collection_name)
+
+        code_chunks = index_repository_source(temp_dir, repo_name, collection_name=collection_name)
 
         repo_summary = summarize_repository_analyses(file_analyses, repo_name)
 
@@ -54,7 +149,8 @@ async def ingest_repository(request: GitIngestRequest):
 
         num_added_summary = add_texts_to_qdrant(
             texts=[repo_summary],
-            metadatas=[{"repo_name": repo_name, "is_summary": True}]
+            metadatas=[{"repo_name": repo_name, "is_summary": True}],
+            collection_name=collection_name
         )
 
         if num_added_summary > 0:
@@ -68,7 +164,9 @@ async def ingest_repository(request: GitIngestRequest):
             "repo_url": repo_url,
             "branch": branch,
             "repo_name": repo_name,
+            "collection": collection_key(collection_name),
             "files_processed": len(file_analyses),
+            "code_chunks_indexed": code_chunks,
             "repo_summary": repo_summary
         }
     except Exception as e:
@@ -82,79 +180,278 @@ async def ingest_repository(request: GitIngestRequest):
             logger.info(f"Cleaning up temporary directory: {temp_dir}")
             shutil.rmtree(temp_dir)
 
+@router.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def ready():
+    """
+    Reports whether the startup warm-up has completed.
+    A failed warm-up is retried in the background on the next call.
+    """
+    if readiness["ready"]:
+        return {"status": "ready", **readiness}
+
+    if not is_warming_up():
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+    return JSONResponse(status_code=503, content={"status": "starting", **readiness})
+
 @router.post("/repositories")
 async def handle_ingest_repository(request: GitIngestRequest):
     return await ingest_repository(request)
 
 @router.post("/query")
 async def query_documents(request: QueryRequest):
+    collection_names = request.collection_names()
     try:
-        db = get_vectorstore()
-        results = db.similarity_search(request.question, k=request.k)
+        results = (await asyncio.to_thread(
+            batch_similarity_search, [request.question], request.k, request.to_filter(), collection_names
+        ))[0]
 
         answer = rag_query(request.question, results)
 
         return {
             "status": "ok",
             "question": request.question,
+            "collections": [collection_key(name) for name in collection_names],
             "answer": answer,
             "raw_results": [doc.page_content for doc in results]
         }
+
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     
     except Exception as e:
         logger.error(f"Error during search: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
+
+@router.post("/query/batch")
+async def query_documents_batch(request: BatchQueryRequest):
+    """
+    Answers several questions in one call.
+    Results are returned in input order, each with its own error if it failed.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions provided")
+    if len(request.questions) > QUERY_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Too many questions: {len(request.questions)} (max {QUERY_BATCH_MAX_QUESTIONS})")
+
+    collection_names = request.collection_names()
+
+    logger.info(f"Starting batch query for {len(request.questions)} questions over {collection_names}")
+    try:
+        results = await rag_query_batch(
+            request.questions, k=request.k, query_filter=request.to_filter(), collection_names=collection_names
+        )
+        failed = sum(1 for result in results if result["error"])
+        logger.info(f"Batch query finished: {len(results) - failed} answered, {failed} failed")
+
+        return {
+            "status": "ok",
+            "collections": [collection_key(name) for name in collection_names],
+            "count": len(results),
+            "failed": failed,
+            "results": results
+        }
+
+    except CollectionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during batch search: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
     
-@router.post("/files")
-async def upload_file(file: UploadFile = File(...)):
-    logger.info(f"Starting file upload: {file.filename}")
-    
-    if not file.filename:
-        logger.error("File without a name")
-        raise HTTPException(status_code=400, detail="File without a name")
+UPLOAD_OPENAPI_EXTRA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}}
+                }
+            }
+        }
+    }
+}
+
+@router.post("/files", openapi_extra=UPLOAD_OPENAPI_EXTRA)
+async def upload_file(request: Request, collection: Optional[str] = None):
+    """
+    Streams an uploaded document to disk and indexes it.
+    Oversized or unsupported files are rejected while the body is still
+    arriving, and a file whose hash is already indexed is not parsed again.
+    The optional `collection` query parameter routes the file to a tenant collection.
+    """
+    collection_name = resolve_collection(collection)
+    logger.info(f"Starting file upload into collection '{collection_name}'")
+    upload = None
 
     try:
-        with tempfile.NamedTemporaryFile(delete=False) as tmpfile:
-            shutil.copyfileobj(file.file, tmpfile)
-            tmpfile_path = tmpfile.name
-        
-        is_valid, message = validate_file(tmpfile_path)
+        try:
+            upload = await receive_upload(request)
+        except UploadRejected as e:
+            logger.error(f"Upload rejected: {e.detail}")
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+        logger.info(f"Received {upload.filename} ({upload.size} bytes, sha256 {upload.sha256})")
+
+        is_valid, message = validate_file(upload.path)
         if not is_valid:
             logger.error(f"Validation failed: {message}")
             raise HTTPException(status_code=400, detail=message)
+
+        if await asyncio.to_thread(is_file_indexed, upload.sha256, collection_name):
+            logger.info(f"File {upload.filename} already indexed, skipping ingestion")
+            return {
+                "status": "ok",
+                "filename": upload.filename,
+                "collection": collection_key(collection_name),
+                "sha256": upload.sha256,
+                "already_indexed": True,
+                "chunks": 0,
+                "validation": message
+            }
         
-        logger.info(f"Starting ingestion for {tmpfile_path}")
-        nb_chunks = add_documents_to_index([tmpfile_path])
-        logger.info(f"Ingestion finished: {nb_chunks} chunks added")
+        logger.info(f"Starting ingestion for {upload.path}")
+        stats = await asyncio.to_thread(
+            add_documents_to_index,
+            [upload.path],
+            {"file_sha256": upload.sha256, "filename": upload.filename},
+            collection_name
+        )
+        skipped = stats["exact_duplicates"] + stats["near_duplicates"]
+        logger.info(f"Ingestion finished: {stats['added']} chunks added, {skipped} duplicates skipped")
         
         return {
             "status": "ok",
-            "filename": file.filename,
-            "chunks": nb_chunks,
+            "filename": upload.filename,
+            "collection": collection_key(collection_name),
+            "sha256": upload.sha256,
+            "already_indexed": False,
+            "chunks": stats["added"],
+            "duplicates_skipped": skipped,
+            "exact_duplicates": stats["exact_duplicates"],
+            "near_duplicates": stats["near_duplicates"],
             "validation": message
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error during processing: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error: {e}")
     
     finally:
-        if 'tmpfile_path' in locals() and os.path.exists(tmpfile_path):
-            os.unlink(tmpfile_path)
+        if upload and os.path.exists(upload.path):
+            os.unlink(upload.path)
+
+@router.get("/collections")
+async def list_collections_endpoint():
+    """
+    Lists the routing keys of the default collection and of every tenant/repository collection.
+    """
+    try:
+        collections = await asyncio.to_thread(list_routed_collections)
+        return {"status": "ok", "collections": [collection_key(name) for name in collections]}
+    except Exception as e:
+        logger.error(f"Error listing collections: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to list collections: {e}")
 
 @router.delete("/collection")
-async def delete_collection_endpoint():
+async def delete_collection_endpoint(collection: Optional[str] = None):
     """
-    Deletes the Qdrant collection specified by QDRANT_COLLECTION_NAME.
+    Deletes one Qdrant collection: the tenant/repository collection selected by
+    the `collection` query parameter, or QDRANT_COLLECTION_NAME by default.
+    Other collections are not affected.
     """
-    logger.info(f"Received request to delete collection: {QDRANT_COLLECTION_NAME}")
+    collection_name = resolve_collection(collection)
+    logger.info(f"Received request to delete collection: {collection_name}")
     try:
-        delete_qdrant_collection(collection_name=QDRANT_COLLECTION_NAME)
-        logger.info(f"Successfully initiated deletion of collection '{QDRANT_COLLECTION_NAME}'.")
+        delete_qdrant_collection(collection_name=collection_name)
+        reset_signature_index(collection_name)
+        logger.info(f"Successfully initiated deletion of collection '{collection_name}'.")
         return JSONResponse(
             status_code=200,
-            content={"message": f"Collection '{QDRANT_COLLECTION_NAME}' scheduled for deletion."}
+            content={"message": f"Collection '{collection_name}' scheduled for deletion.", "collection": collection_key(collection_name)}
         )
+    except CollectionNotFoundError as e:
+        reset_signature_index(collection_name)
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"Error during collection deletion endpoint: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to delete collection '{QDRANT_COLLECTION_NAME}': {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete collection '{collection_name}': {str(e)}")
+
+@router.post("/collection/export")
+async def export_collection_endpoint(request: ExportRequest):
+    """
+    Exports the collection's vectors and payloads to a local snapshot under SNAPSHOT_DIR.
+    """
+    path = resolve_snapshot_path(request.name)
+    collection_name = resolve_collection(request.collection)
+    logger.info(f"Received request to export collection '{collection_name}' to {path}")
+    try:
+        manifest = await asyncio.to_thread(export_collection, path, collection_name, request.quantize)
+        return {"status": "ok", "name": request.name, "manifest": manifest}
+    except Exception as e:
+        logger.error(f"Error during collection export: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to export collection '{collection_name}': {e}")
+
+@router.post("/collection/import")
+async def import_collection_endpoint(request: ImportRequest):
+    """
+    Bulk-loads a local snapshot from SNAPSHOT_DIR into the collection.
+    """
+    path = resolve_snapshot_path(request.name)
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail=f"Snapshot not found: {request.name}")
+
+    collection_name = resolve_collection(request.collection)
+    logger.info(f"Received request to import {path} into collection '{collection_name}'")
+    try:
+        manifest = await asyncio.to_thread(import_collection, path, collection_name, request.recreate)
+        return {"status": "ok", "name": request.name, "manifest": manifest}
+    except Exception as e:
+        logger.error(f"Error during collection import: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to import snapshot '{request.name}': {e}")
+
+@router.post("/collection/snapshots")
+async def create_snapshot_endpoint(collection: Optional[str] = None):
+    """
+    Creates a native Qdrant snapshot of the collection on the Qdrant server.
+    """
+    collection_name = resolve_collection(collection)
+    try:
+        snapshot = await asyncio.to_thread(create_qdrant_snapshot, collection_name)
+        return {"status": "ok", "snapshot": snapshot}
+    except Exception as e:
+        logger.error(f"Error during Qdrant snapshot creation: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to create snapshot of '{collection_name}': {e}")
+
+@router.get("/collection/snapshots")
+async def list_snapshots_endpoint(collection: Optional[str] = None):
+    collection_name = resolve_collection(collection)
+    try:
+        snapshots = await asyncio.to_thread(list_qdrant_snapshots, collection_name)
+        return {"status": "ok", "snapshots": snapshots}
+    except Exception as e:
+        logger.error(f"Error listing Qdrant snapshots: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to list snapshots of '{collection_name}': {e}")
+
+@router.post("/collection/snapshots/recover")
+async def recover_snapshot_endpoint(request: RecoverSnapshotRequest):
+    """
+    Restores the collection from one of its native Qdrant snapshots, by name
+    (see GET /collection/snapshots).
+    """
+    collection_name = resolve_collection(request.collection)
+    try:
+        await asyncio.to_thread(recover_qdrant_snapshot, request.name, collection_name)
+        return {"status": "ok", "name": request.name}
+    except SnapshotNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during Qdrant snapshot recovery: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to recover '{collection_name}' from snapshot: {e}")
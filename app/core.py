@@ -1,13 +1,15 @@
 #app/core.py
 # This file defines core functionalities like LLM and vector store initialization.
+# Heavy client libraries are imported on first use so that importing the app stays fast.
 # Author: Yassine Amounane
 import os
 import logging
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
 from dotenv import load_dotenv
-from langchain_mistralai.chat_models import ChatMistralAI
-from langchain_mistralai.embeddings import MistralAIEmbeddings
-from qdrant_client import QdrantClient, models
-from langchain_qdrant import QdrantVectorStore
 from app.settings import (
     MISTRAL_API_KEY,
     MISTRAL_LLM_ANALYZE_CODE_MODEL,
@@ -15,74 +17,294 @@ from app.settings import (
     MISTRAL_EMBEDDINGS_MODEL,
     QDRANT_HOST,
     QDRANT_PORT,
-    QDRANT_COLLECTION_NAME
+    QDRANT_COLLECTION_NAME,
+    QDRANT_SHARD_NUMBER,
+    QDRANT_REPLICATION_FACTOR
 )
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_EMBEDDING_DIM = 512
+
+# Payload fields that are filtered on and get an index in every collection.
+PAYLOAD_INDEX_FIELDS = {
+    "metadata.file_sha256": "keyword",
+    "metadata.duplicate_file_sha256": "keyword",
+    "metadata.repo_name": "keyword",
+    "metadata.file_path": "keyword",
+    "metadata.symbol": "keyword",
+    "metadata.is_code_chunk": "bool",
+}
+
+# Routing keys select a collection per tenant or per repository: "<QDRANT_COLLECTION_NAME>__<key>".
+COLLECTION_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+COLLECTION_KEY_SEPARATOR = "__"
+COLLECTION_KEY_PREFIX = f"{QDRANT_COLLECTION_NAME}{COLLECTION_KEY_SEPARATOR}"
+
+_vectorstores: dict = {}
+_collection_dimensions: dict[str, int] = {}
+# One lock per collection, so opening a slow or cold collection does not block the others.
+_collection_locks: dict[str, threading.Lock] = {}
+_collection_locks_guard = threading.Lock()
+_warmup_lock = threading.Lock()
+
+readiness = {"ready": False, "error": None, "warmup_seconds": None}
+
+@lru_cache(maxsize=None)
 def get_embeddings():
+    from langchain_mistralai.embeddings import MistralAIEmbeddings
     return MistralAIEmbeddings(api_key=MISTRAL_API_KEY, model=MISTRAL_EMBEDDINGS_MODEL)
 
+@lru_cache(maxsize=None)
 def get_llm_code():
+    from langchain_mistralai.chat_models import ChatMistralAI
     return ChatMistralAI(model=MISTRAL_LLM_ANALYZE_CODE_MODEL, api_key=MISTRAL_API_KEY)
 
+@lru_cache(maxsize=None)
 def get_llm_query():
+    from langchain_mistralai.chat_models import ChatMistralAI
     return ChatMistralAI(model=MISTRAL_LLM_QUERY_MODEL, api_key=MISTRAL_API_KEY)
 
-def get_vectorstore():
+@lru_cache(maxsize=None)
+def get_qdrant_client():
+    from qdrant_client import QdrantClient
+    return QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+
+@lru_cache(maxsize=None)
+def get_embedding_dimension() -> int:
     """
-    Initializes and returns a Qdrant vector store client.
-    Checks if the collection exists and creates it if not.
+    Determines the embedding dimension once and caches it.
+    Raises ValueError if it cannot be determined.
     """
-    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
     embeddings = get_embeddings()
 
+    embedding_dim = 0
+    if hasattr(embeddings, 'embed_query'):
+        try:
+            test_embedding = embeddings.embed_query("test")
+            embedding_dim = len(test_embedding)
+            logger.info(f"Determined embedding dimension: {embedding_dim}")
+        except Exception as emb_ex:
+            logger.error(f"Could not determine embedding dimension dynamically via embed_query: {emb_ex}")
+    elif hasattr(embeddings, 'client') and hasattr(embeddings.client, 'get_sentence_embedding_dimension'):
+        try:
+            embedding_dim = embeddings.client.get_sentence_embedding_dimension()
+            logger.info(f"Determined embedding dimension via get_sentence_embedding_dimension: {embedding_dim}")
+        except Exception as emb_ex_alt:
+             logger.error(f"Could not determine embedding dimension dynamically via get_sentence_embedding_dimension: {emb_ex_alt}")
+
+    if embedding_dim == 0:
+        raise ValueError("Could not determine embedding dimension")
+    return embedding_dim
+
+class CollectionNotFoundError(Exception):
+    pass
+
+def resolve_collection_name(key: Optional[str] = None) -> str:
+    """
+    Maps a tenant or repository routing key to its Qdrant collection name.
+    No key selects the default collection. A full collection name (already
+    prefixed with "<QDRANT_COLLECTION_NAME>__") is accepted as well.
+
+    Raises:
+        ValueError: If the key contains characters other than letters, digits, '_' and '-'.
+    """
+    if not key or key == QDRANT_COLLECTION_NAME:
+        return QDRANT_COLLECTION_NAME
+    if key.startswith(COLLECTION_KEY_PREFIX):
+        key = key[len(COLLECTION_KEY_PREFIX):]
+    if not COLLECTION_KEY_PATTERN.match(key):
+        raise ValueError(f"Invalid collection key: {key}")
+    return f"{COLLECTION_KEY_PREFIX}{key}"
+
+def collection_key(collection_name: str) -> str:
+    """
+    Returns the routing key of a collection name, as accepted by resolve_collection_name.
+    The default collection's key is its name.
+    """
+    if collection_name.startswith(COLLECTION_KEY_PREFIX):
+        return collection_name[len(COLLECTION_KEY_PREFIX):]
+    return collection_name
+
+def list_routed_collections() -> list[str]:
+    """Returns the default collection and every routed collection that exists in Qdrant."""
+    names = [collection.name for collection in get_qdrant_client().get_collections().collections]
+    return sorted(name for name in names if name == QDRANT_COLLECTION_NAME or name.startswith(COLLECTION_KEY_PREFIX))
+
+def _ensure_collection(client, collection_name: str, create: bool = True):
+    from qdrant_client import models
+
     try:
-        client.get_collection(collection_name=QDRANT_COLLECTION_NAME)
-        logger.info(f"Collection '{QDRANT_COLLECTION_NAME}' already exists.")
+        info = client.get_collection(collection_name=collection_name)
+        logger.info(f"Collection '{collection_name}' already exists.")
+        vectors = info.config.params.vectors
+        if isinstance(vectors, models.VectorParams):
+            _collection_dimensions[collection_name] = vectors.size
     except Exception as e:
-        logger.warning(f"Collection '{QDRANT_COLLECTION_NAME}' not found or error checking: {e}. Attempting to create it.")
-
-        embedding_dim = 0
-        if hasattr(embeddings, 'embed_query'):
-            try:
-                test_embedding = embeddings.embed_query("test")
-                embedding_dim = len(test_embedding)
-                logger.info(f"Determined embedding dimension: {embedding_dim}")
-            except Exception as emb_ex:
-                logger.error(f"Could not determine embedding dimension dynamically via embed_query: {emb_ex}")
-        elif hasattr(embeddings, 'client') and hasattr(embeddings.client, 'get_sentence_embedding_dimension'):
-            try:
-                embedding_dim = embeddings.client.get_sentence_embedding_dimension()
-                logger.info(f"Determined embedding dimension via get_sentence_embedding_dimension: {embedding_dim}")
-            except Exception as emb_ex_alt:
-                 logger.error(f"Could not determine embedding dimension dynamically via get_sentence_embedding_dimension: {emb_ex_alt}")
-
-        if embedding_dim == 0:
-            default_dim = 512
-            logger.info(f"Could not determine embedding dimension programmatically, using default {default_dim}.")
-            embedding_dim = default_dim
+        if not create:
+            raise CollectionNotFoundError(f"Collection '{collection_name}' not found: {e}")
+
+        logger.warning(f"Collection '{collection_name}' not found or error checking: {e}. Attempting to create it.")
+
+        try:
+            embedding_dim = get_embedding_dimension()
+        except ValueError:
+            logger.info(f"Could not determine embedding dimension programmatically, using default {DEFAULT_EMBEDDING_DIM}.")
+            embedding_dim = DEFAULT_EMBEDDING_DIM
 
         try:
             client.create_collection(
-                collection_name=QDRANT_COLLECTION_NAME,
-                vectors_config=models.VectorParams(size=embedding_dim, distance=models.Distance.COSINE)
+                collection_name=collection_name,
+                vectors_config=models.VectorParams(size=embedding_dim, distance=models.Distance.COSINE),
+                shard_number=QDRANT_SHARD_NUMBER,
+                replication_factor=QDRANT_REPLICATION_FACTOR
             )
-            logger.info(f"Successfully created collection '{QDRANT_COLLECTION_NAME}' with vector size {embedding_dim}.")
+            _collection_dimensions[collection_name] = embedding_dim
+            logger.info(f"Successfully created collection '{collection_name}' with vector size {embedding_dim} "
+                        f"({QDRANT_SHARD_NUMBER} shards, replication factor {QDRANT_REPLICATION_FACTOR}).")
         except Exception as create_ex:
-            logger.error(f"Failed to create collection '{QDRANT_COLLECTION_NAME}': {create_ex}", exc_info=True)
+            logger.error(f"Failed to create collection '{collection_name}': {create_ex}", exc_info=True)
             raise create_ex
 
-    vectorstore = QdrantVectorStore(
-        client=client,
-        collection_name=QDRANT_COLLECTION_NAME,
-        embedding=embeddings,
-        content_payload_key="text",
-        metadata_payload_key="metadata"
-    )
-    return vectorstore
+def _ensure_payload_indexes(client, collection_name: str):
+    from qdrant_client import models
+
+    for field_name, field_schema in PAYLOAD_INDEX_FIELDS.items():
+        try:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=models.PayloadSchemaType(field_schema)
+            )
+        except Exception as e:
+            logger.warning(f"Could not create payload index '{field_name}' on '{collection_name}': {e}")
+
+def _collection_lock(collection_name: str) -> threading.Lock:
+    with _collection_locks_guard:
+        return _collection_locks.setdefault(collection_name, threading.Lock())
+
+def get_vectorstore(collection_name: str = QDRANT_COLLECTION_NAME, create: bool = True):
+    """
+    Initializes and returns a Qdrant vector store client for a collection.
+    Checks if the collection exists and creates it if not (unless create is False).
+    Payload indexes are only ensured on the create path; create=False only reads.
+    One vector store is cached per collection after the first successful call.
+
+    Raises:
+        CollectionNotFoundError: If the collection does not exist and create is False.
+    """
+    vectorstore = _vectorstores.get(collection_name)
+    if vectorstore is not None:
+        return vectorstore
+
+    with _collection_lock(collection_name):
+        vectorstore = _vectorstores.get(collection_name)
+        if vectorstore is not None:
+            return vectorstore
+
+        from langchain_qdrant import QdrantVectorStore
+
+        client = get_qdrant_client()
+        _ensure_collection(client, collection_name, create=create)
+        if create:
+            _ensure_payload_indexes(client, collection_name)
+
+        # The vector size is already recorded by _ensure_collection; validating the
+        # config again would cost an embeddings request per collection.
+        vectorstore = QdrantVectorStore(
+            client=client,
+            collection_name=collection_name,
+            embedding=get_embeddings(),
+            content_payload_key="text",
+            metadata_payload_key="metadata",
+            validate_collection_config=False
+        )
+        _vectorstores[collection_name] = vectorstore
+        return vectorstore
+
+def is_collection_not_found(error: Exception) -> bool:
+    """Returns True if a Qdrant client error means the collection does not exist."""
+    from qdrant_client.http.exceptions import UnexpectedResponse
+
+    if isinstance(error, UnexpectedResponse) and error.status_code == 404:
+        return True
+    message = str(error).lower()
+    return "collection" in message and ("not found" in message or "doesn't exist" in message)
+
+def run_on_collection(collection_name: str, operation, create: bool = True):
+    """
+    Runs operation(vectorstore) on the cached vector store of a collection.
+    If Qdrant reports that the collection is gone (deleted by another replica
+    or directly in Qdrant), the cached handle is dropped and the operation is
+    retried once with a fresh one, which recreates the collection unless
+    create is False.
+
+    Raises:
+        CollectionNotFoundError: If the collection does not exist and create is False.
+    """
+    vectorstore = get_vectorstore(collection_name, create=create)
+    try:
+        return operation(vectorstore)
+    except Exception as e:
+        if not is_collection_not_found(e):
+            raise
+        logger.warning(f"Collection '{collection_name}' not found in Qdrant, reopening it: {e}")
+        invalidate_vectorstore(collection_name)
+        return operation(get_vectorstore(collection_name, create=create))
+
+def get_collection_dimension(collection_name: str) -> Optional[int]:
+    """Returns the vector size of a collection once its handle has been opened."""
+    return _collection_dimensions.get(collection_name)
+
+def invalidate_vectorstore(collection_name: Optional[str] = None):
+    """
+    Drops the cached vector store of a collection (or of all collections)
+    so the collection is checked again on next use.
+    """
+    if collection_name is None:
+        with _collection_locks_guard:
+            _vectorstores.clear()
+            _collection_dimensions.clear()
+        return
+
+    with _collection_lock(collection_name):
+        _vectorstores.pop(collection_name, None)
+        _collection_dimensions.pop(collection_name, None)
+
+def warm_up():
+    """
+    Prepares the Qdrant client, the embedding dimension, the collection handle
+    and the LLM clients so that the first request does not pay for them.
+    The document parser is not loaded here; it is loaded on the first upload.
+    Concurrent calls return immediately while a warm-up is already running.
+    """
+    if not _warmup_lock.acquire(blocking=False):
+        return readiness
+
+    try:
+        start = time.perf_counter()
+        readiness["error"] = None
+        try:
+            get_embedding_dimension()
+            get_vectorstore()
+            get_llm_query()
+            get_llm_code()
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}", exc_info=True)
+            readiness["error"] = str(e)
+            return readiness
+
+        readiness["warmup_seconds"] = round(time.perf_counter() - start, 3)
+        readiness["ready"] = True
+        logger.info(f"Warm-up completed in {readiness['warmup_seconds']}s")
+        return readiness
+    finally:
+        _warmup_lock.release()
+
+def is_warming_up() -> bool:
+    return _warmup_lock.locked()
 
 def delete_qdrant_collection(collection_name: str):
     """
@@ -90,10 +312,18 @@ def delete_qdrant_collection(collection_name: str):
 
     Args:
         collection_name: The name of the collection to delete.
+
+    Raises:
+        CollectionNotFoundError: If the collection does not exist.
     """
-    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+    client = get_qdrant_client()
+    if not client.collection_exists(collection_name=collection_name):
+        invalidate_vectorstore(collection_name)
+        raise CollectionNotFoundError(f"Collection '{collection_name}' not found")
     try:
         client.delete_collection(collection_name=collection_name)
         logger.info(f"Collection '{collection_name}' deleted successfully.")
     except Exception as e:
         logger.error(f"Failed to delete collection '{collection_name}': {e}", exc_info=True)
+    finally:
+        invalidate_vectorstore(collection_name)
@@ -2,17 +2,21 @@
 # This file handles document processing and indexing.
 # Author: Yassine Amounane
 import re
-from typing import List
-from langchain_unstructured import UnstructuredLoader as UnstructuredFileLoader
-from qdrant_client import QdrantClient, models
-import uuid
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from .core import get_embeddings, QDRANT_HOST, QDRANT_PORT, QDRANT_COLLECTION_NAME, get_vectorstore
+from typing import List, Optional, TYPE_CHECKING
+from .core import get_embeddings, QDRANT_COLLECTION_NAME, get_vectorstore, run_on_collection
+from .settings import CODE_EMBED_BATCH_SIZE, DEDUP_NEAR_DUPLICATES
+from .utils.dedup import MinHasher, SignatureIndex, content_hash, get_signature_index, point_id_for
 import logging
 
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient
+
 logger = logging.getLogger(__name__)
 
 def load_documents(file_paths: List[str]):
+    # The unstructured parser is slow to import, so it is only loaded on the first upload.
+    from langchain_unstructured import UnstructuredLoader as UnstructuredFileLoader
+
     docs = []
     for path in file_paths:
         try:
@@ -31,6 +35,8 @@ def load_documents(file_paths: List[str]):
     return docs
 
 def split_documents(docs, chunk_size: int = 1000, chunk_overlap: int = 100):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
@@ -38,11 +44,165 @@ def split_documents(docs, chunk_size: int = 1000, chunk_overlap: int = 100):
     )
     return splitter.split_documents(docs)
 
-def add_documents_to_index(paths: List[str]) -> int:
+def _empty_ingest_stats() -> dict:
+    return {"added": 0, "exact_duplicates": 0, "near_duplicates": 0}
+
+def deduplicate_chunks(chunks, client: "QdrantClient", collection_name: str):
+    """
+    Drops chunks that are already indexed or near-identical to an indexed chunk.
+
+    Exact duplicates are detected by content hash: within the batch, and
+    against Qdrant through the deterministic point ID derived from the hash.
+    Near duplicates are detected with MinHash/LSH against the collection's
+    local signature index (confirmed against Qdrant) and against the chunks
+    kept earlier in the batch.
+
+    Returns:
+        A tuple (kept, pending_signatures, stats, matched_ids) where kept is a
+        list of (point_id, chunk) pairs, pending_signatures must be added to
+        the signature index once the points are stored, and matched_ids are
+        the stored points that skipped chunks duplicate.
+    """
+    stats = _empty_ingest_stats()
+    matched_ids = []
+
+    unique = {}
+    for chunk in chunks:
+        digest = content_hash(chunk.page_content)
+        if digest in unique:
+            stats["exact_duplicates"] += 1
+            continue
+        chunk.metadata["content_hash"] = digest
+        unique[digest] = chunk
+
+    candidates = [(point_id_for(digest), chunk) for digest, chunk in unique.items()]
+
+    try:
+        existing = client.retrieve(
+            collection_name=collection_name,
+            ids=[point_id for point_id, _ in candidates],
+            with_payload=False,
+            with_vectors=False
+        )
+        existing_ids = {str(point.id) for point in existing}
+    except Exception as e:
+        logger.warning(f"Could not check existing points in '{collection_name}': {e}")
+        existing_ids = set()
+
+    matched_ids.extend(point_id for point_id, _ in candidates if point_id in existing_ids)
+    stats["exact_duplicates"] += len(matched_ids)
+    candidates = [(point_id, chunk) for point_id, chunk in candidates if point_id not in existing_ids]
+
+    if not DEDUP_NEAR_DUPLICATES:
+        return candidates, [], stats, matched_ids
+
+    minhasher = MinHasher()
+    index = get_signature_index(collection_name)
+    batch_index = SignatureIndex()
+    live_keys = set()
+    kept = []
+    pending_signatures = []
+    for point_id, chunk in candidates:
+        signature = minhasher.signature(chunk.page_content)
+        stored_match = _find_stored_duplicate(index, signature, client, collection_name, live_keys)
+        if stored_match:
+            matched_ids.append(stored_match[0])
+        match = stored_match or batch_index.find_duplicate(signature)
+        if match:
+            stats["near_duplicates"] += 1
+            logger.debug(f"Chunk {point_id} is a near duplicate of {match[0]} (similarity {match[1]:.2f})")
+            continue
+        batch_index.add_many([(point_id, signature)])
+        pending_signatures.append((point_id, signature))
+        kept.append((point_id, chunk))
+
+    return kept, pending_signatures, stats, matched_ids
+
+def _find_stored_duplicate(index: SignatureIndex, signature: list[int], client: "QdrantClient",
+                           collection_name: str, live_keys: set):
+    """
+    Looks up a near duplicate in the collection's signature index and confirms
+    that its point still exists in Qdrant. The local index is not kept in sync
+    with Qdrant (collection deleted by another replica or directly, snapshot
+    recovered...), so signatures of points that are gone are dropped and the
+    lookup is repeated.
+    """
+    while True:
+        match = index.find_duplicate(signature)
+        if match is None or match[0] in live_keys:
+            return match
+        try:
+            found = client.retrieve(collection_name=collection_name, ids=[match[0]], with_payload=False, with_vectors=False)
+        except Exception as e:
+            logger.warning(f"Could not confirm near duplicate {match[0]} in '{collection_name}', keeping the chunk: {e}")
+            return None
+        if found:
+            live_keys.add(match[0])
+            return match
+        logger.info(f"Dropping stale signature {match[0]} from the signature index of '{collection_name}'")
+        index.discard(match[0])
+
+def _record_duplicate_file(client: "QdrantClient", collection_name: str, point_id: str, file_sha256: str):
+    """
+    Records the hash of a file whose chunks were all skipped as duplicates on
+    a stored point it duplicates, so is_file_indexed finds the file next time.
+    """
+    found = client.retrieve(collection_name=collection_name, ids=[point_id], with_payload=True, with_vectors=False)
+    if not found:
+        return
+    hashes = list(((found[0].payload or {}).get("metadata") or {}).get("duplicate_file_sha256") or [])
+    if file_sha256 in hashes:
+        return
+    client.set_payload(
+        collection_name=collection_name,
+        payload={"duplicate_file_sha256": hashes + [file_sha256]},
+        points=[point_id],
+        key="metadata",
+        wait=True
+    )
+    logger.info(f"Recorded file {file_sha256} as a duplicate on point {point_id}")
+
+def is_file_indexed(file_sha256: str, collection_name: str = QDRANT_COLLECTION_NAME) -> bool:
+    """
+    Returns True if a file with this SHA-256 is already stored in the collection:
+    its chunks carry the hash, or it was recorded on a point all its chunks duplicate.
+    """
+    from qdrant_client import models
+
+    result = run_on_collection(collection_name, lambda vectorstore: vectorstore.client.count(
+        collection_name=vectorstore.collection_name,
+        count_filter=models.Filter(should=[
+            models.FieldCondition(key="metadata.file_sha256", match=models.MatchValue(value=file_sha256)),
+            models.FieldCondition(key="metadata.duplicate_file_sha256", match=models.MatchValue(value=file_sha256)),
+        ]),
+        exact=True
+    ))
+    return result.count > 0
+
+def add_documents_to_index(paths: List[str], metadata: Optional[dict] = None,
+                           collection_name: str = QDRANT_COLLECTION_NAME) -> dict:
+    """
+    Loads, splits, deduplicates, embeds and stores documents in Qdrant.
+
+    Args:
+        paths: The files to index.
+        metadata: Extra metadata added to every chunk (e.g. the file hash).
+        collection_name: The target collection.
+
+    Returns:
+        A dict with the number of chunks added and the number of exact and
+        near duplicate chunks skipped.
+    """
+    stats = _empty_ingest_stats()
+
     docs = load_documents(paths) 
     if not docs:
         logger.warning("No documents to index")
-        return 0
+        return stats
+
+    if metadata:
+        for doc in docs:
+            doc.metadata.update(metadata)
 
     chunks = split_documents(docs)
 
@@ -51,78 +211,162 @@ def add_documents_to_index(paths: List[str]) -> int:
 
     if not valid_chunks:
         logger.warning("No valid chunks to index after filtering.")
-        return 0
+        return stats
 
-    embeddings_model = get_embeddings()
-    
-    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+    from qdrant_client import models
 
-    collection_name = QDRANT_COLLECTION_NAME
+    embeddings_model = get_embeddings()
 
     try:
-        test_embedding = embeddings_model.embed_query("test")
-        vector_size = len(test_embedding)
+        client = get_vectorstore(collection_name).client
     except Exception as e:
-        logger.error(f"Error getting embedding dimension: {e}", exc_info=True)
-        return 0
+        logger.error(f"Could not open collection '{collection_name}': {e}", exc_info=True)
+        return stats
+
+    kept, pending_signatures, stats, matched_ids = deduplicate_chunks(valid_chunks, client, collection_name)
+    logger.info(
+        f"Deduplication: {len(kept)} chunks kept, {stats['exact_duplicates']} exact and "
+        f"{stats['near_duplicates']} near duplicates skipped"
+    )
+
+    if not kept:
+        logger.warning("No new chunks to add to Qdrant after deduplication.")
+        file_sha256 = (metadata or {}).get("file_sha256")
+        if file_sha256 and matched_ids:
+            try:
+                _record_duplicate_file(client, collection_name, matched_ids[0], file_sha256)
+            except Exception as e:
+                logger.warning(f"Could not record duplicate file {file_sha256} in '{collection_name}': {e}")
+        return stats
 
     try:
-        collection_info = client.get_collection(collection_name=collection_name)
-        logger.info(f"Using existing collection: '{collection_name}'")
+        chunk_embeddings = embeddings_model.embed_documents([chunk.page_content for _, chunk in kept])
     except Exception as e:
-        logger.info(f"Collection '{collection_name}' not found or error checking: {e}. Attempting creation.")
-        try:
-            client.recreate_collection(
-                collection_name=collection_name,
-                vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE)
-            )
-            logger.info(f"Collection '{collection_name}' created.")
-        except Exception as create_exc:
-            logger.error(f"Could not create collection '{collection_name}': {create_exc}", exc_info=True)
-            return 0
-
-    points_to_upsert = []
-    for i, chunk in enumerate(valid_chunks):
-        try:
-            chunk_embedding = embeddings_model.embed_documents([chunk.page_content])[0]
-
-            point = models.PointStruct(
-                id=str(uuid.uuid4()),
-                payload={
-                    "text": chunk.page_content,
-                    "metadata": chunk.metadata,
-                },
-                vector=chunk_embedding
-            )
-            points_to_upsert.append(point)
-        except Exception as e:
-            logger.error(f"Error processing chunk {i}: {e}", exc_info=True)
+        logger.error(f"Error embedding {len(kept)} chunks: {e}", exc_info=True)
+        return stats
 
-    if not points_to_upsert:
-        logger.warning("No points to add to Qdrant.")
-        return 0
+    points_to_upsert = [
+        models.PointStruct(
+            id=point_id,
+            payload={
+                "text": chunk.page_content,
+                "metadata": chunk.metadata,
+            },
+            vector=chunk_embedding
+        )
+        for (point_id, chunk), chunk_embedding in zip(kept, chunk_embeddings)
+    ]
 
     try:
-        client.upsert(collection_name=collection_name, points=points_to_upsert, wait=True)
+        run_on_collection(collection_name, lambda vectorstore: vectorstore.client.upsert(
+            collection_name=collection_name, points=points_to_upsert, wait=True
+        ))
         logger.info(f"{len(points_to_upsert)} valid chunks (points) added to Qdrant collection '{collection_name}'")
-        return len(points_to_upsert)
     except Exception as e:
         logger.error(f"Error upserting points to Qdrant collection '{collection_name}': {e}", exc_info=True)
+        return stats
+
+    if pending_signatures:
+        get_signature_index(collection_name).add_many(pending_signatures)
+
+    stats["added"] = len(points_to_upsert)
+    return stats
+
+def delete_code_chunks(repo_name: str, collection_name: str = QDRANT_COLLECTION_NAME):
+    """
+    Removes the source chunks of a repository, so a re-ingestion does not leave stale code behind.
+    """
+    from qdrant_client import models
+
+    run_on_collection(collection_name, lambda vectorstore: vectorstore.client.delete(
+        collection_name=vectorstore.collection_name,
+        points_selector=models.FilterSelector(filter=models.Filter(must=[
+            models.FieldCondition(key="metadata.repo_name", match=models.MatchValue(value=repo_name)),
+            models.FieldCondition(key="metadata.is_code_chunk", match=models.MatchValue(value=True)),
+        ])),
+        wait=True
+    ))
+    logger.info(f"Deleted existing source chunks of repository '{repo_name}'")
+
+def add_code_chunks_to_index(chunks: List[dict], batch_size: int = CODE_EMBED_BATCH_SIZE,
+                             collection_name: str = QDRANT_COLLECTION_NAME) -> int:
+    """
+    Embeds repository source chunks in batches and stores them in Qdrant.
+
+    Args:
+        chunks: Dicts with "text" and "metadata" (repo_name, file_path, symbol, line range...).
+        batch_size: Number of chunks per embeddings request and upsert.
+        collection_name: The target collection.
+
+    Returns:
+        The number of chunks stored.
+    """
+    from qdrant_client import models
+
+    if not chunks:
         return 0
 
+    embeddings_model = get_embeddings()
+
+    def embed_batch(batch: List[dict]) -> list:
+        """Embeds a batch; if the request fails, retries chunk by chunk so one bad chunk does not drop the others."""
+        try:
+            return embeddings_model.embed_documents([chunk["text"] for chunk in batch])
+        except Exception as e:
+            logger.warning(f"Embedding {len(batch)} source chunks failed, retrying one by one: {e}")
+
+        vectors = []
+        for chunk in batch:
+            try:
+                vectors.append(embeddings_model.embed_documents([chunk["text"]])[0])
+            except Exception as e:
+                metadata = chunk["metadata"]
+                logger.error(f"Skipping source chunk {metadata['file_path']}:{metadata['start_line']} that could not be embedded: {e}")
+                vectors.append(None)
+        return vectors
+
+    added = 0
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        try:
+            vectors = embed_batch(batch)
+            points = [
+                models.PointStruct(
+                    id=point_id_for(content_hash(
+                        f"{chunk['metadata']['repo_name']}:{chunk['metadata']['file_path']}:{chunk['metadata']['start_line']}:{chunk['text']}"
+                    )),
+                    payload={"text": chunk["text"], "metadata": chunk["metadata"]},
+                    vector=vector
+                )
+                for chunk, vector in zip(batch, vectors)
+                if vector is not None
+            ]
+            if not points:
+                continue
+            run_on_collection(collection_name, lambda vectorstore: vectorstore.client.upsert(
+                collection_name=vectorstore.collection_name, points=points, wait=True
+            ))
+            added += len(points)
+        except Exception as e:
+            logger.error(f"Error indexing source chunks {start}-{start + len(batch)}: {e}", exc_info=True)
+
+    logger.info(f"{added}/{len(chunks)} source chunks added to Qdrant collection '{collection_name}'")
+    return added
+
 def clean_text(text):
     text = re.sub(r"[^\S\r\n]+", " ", text)
     text = re.sub(r"[\x7f\x80-\xff]", "", text)
     text = re.sub(r"coordinates.*?\}\}", "", text, flags=re.DOTALL)
     return text.strip()
 
-def add_texts_to_qdrant(texts: List[str], metadatas: List[dict]) -> int:
+def add_texts_to_qdrant(texts: List[str], metadatas: List[dict], collection_name: str = QDRANT_COLLECTION_NAME) -> int:
     """
-    Adds a list of texts and their corresponding metadatas to the global Qdrant collection.
+    Adds a list of texts and their corresponding metadatas to a Qdrant collection.
 
     Args:
         texts: A list of strings to be added.
         metadatas: A list of dictionaries, each corresponding to a text.
+        collection_name: The target collection, the global one by default.
 
     Returns:
         The number of texts successfully added.
@@ -132,11 +376,9 @@ def add_texts_to_qdrant(texts: List[str], metadatas: List[dict]) -> int:
         return 0
 
     try:
-        vectorstore = get_vectorstore()
-
-        vectorstore.add_texts(texts=texts, metadatas=metadatas)
-        logger.info(f"Successfully added {len(texts)} texts to Qdrant collection '{QDRANT_COLLECTION_NAME}'. Metadata example: {metadatas[0] if metadatas else 'N/A'}")
+        run_on_collection(collection_name, lambda vectorstore: vectorstore.add_texts(texts=texts, metadatas=metadatas))
+        logger.info(f"Successfully added {len(texts)} texts to Qdrant collection '{collection_name}'. Metadata example: {metadatas[0] if metadatas else 'N/A'}")
         return len(texts)
     except Exception as e:
-        logger.error(f"Error adding texts to Qdrant collection '{QDRANT_COLLECTION_NAME}': {str(e)}", exc_info=True)
+        logger.error(f"Error adding texts to Qdrant collection '{collection_name}': {str(e)}", exc_info=True)
         return 0
\ No newline at end of file
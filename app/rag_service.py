@@ -1,21 +1,167 @@
 # app/rag_service.py
 # This file implements the RAG service for querying and summarization.
 # Author: Yassine Amounane
+import asyncio
 import logging
 import json
-from app.core import get_llm_code, get_llm_query
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, TYPE_CHECKING
+from app.core import get_collection_dimension, get_embeddings, get_llm_code, get_llm_query, run_on_collection
 from app.rag_prompt import RAG_PROMPT
+from app.settings import QDRANT_COLLECTION_NAME, QUERY_BATCH_CONCURRENCY
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from qdrant_client import models
 
 logger = logging.getLogger(__name__)
 
-def rag_query(question: str, chunks: list):
+def build_rag_prompt(question: str, chunks: list) -> str:
     context = "\n\n".join([chunk.page_content for chunk in chunks])
-    prompt = RAG_PROMPT.format(context=context, question=question)
+    return RAG_PROMPT.format(context=context, question=question)
+
+def build_query_filter(repo_name: Optional[str] = None, file_path: Optional[str] = None,
+                       symbol: Optional[str] = None, code_only: bool = False) -> Optional["models.Filter"]:
+    """
+    Builds a Qdrant filter on chunk metadata, or returns None when nothing is filtered.
+    code_only restricts results to repository source chunks.
+    """
+    from qdrant_client import models
+
+    conditions = [
+        models.FieldCondition(key=f"metadata.{key}", match=models.MatchValue(value=value))
+        for key, value in (("repo_name", repo_name), ("file_path", file_path), ("symbol", symbol))
+        if value
+    ]
+    if code_only:
+        conditions.append(models.FieldCondition(key="metadata.is_code_chunk", match=models.MatchValue(value=True)))
+
+    return models.Filter(must=conditions) if conditions else None
+
+def rag_query(question: str, chunks: list):
+    prompt = build_rag_prompt(question, chunks)
     
     llm = get_llm_query()
     response = llm.invoke(prompt)
     return response.content.strip()
 
+async def arag_query(question: str, chunks: list, llm=None) -> str:
+    prompt = build_rag_prompt(question, chunks)
+
+    llm = llm or get_llm_query()
+    response = await llm.ainvoke(prompt)
+    return response.content.strip()
+
+def batch_similarity_search(questions: list[str], k: int, query_filter: Optional["models.Filter"] = None,
+                            collection_names: Optional[list[str]] = None) -> list[list["Document"]]:
+    """
+    Retrieves the top-k chunks for several questions at once.
+    All questions are embedded in a single embeddings request and searched
+    with one Qdrant batch query per collection instead of one round-trip per
+    question. When several collections are given they are searched in
+    parallel and the hits of each question are merged by score.
+
+    Raises:
+        CollectionNotFoundError: If a routed (non-default) collection does not exist.
+
+    Returns:
+        One list of Documents per question, in input order.
+    """
+    if not questions:
+        return []
+
+    from langchain_core.documents import Document
+    from qdrant_client import models
+
+    collection_names = collection_names or [QDRANT_COLLECTION_NAME]
+    vectors = get_embeddings().embed_documents(questions)
+
+    requests = [
+        models.QueryRequest(query=vector, filter=query_filter, limit=k, with_payload=True)
+        for vector in vectors
+    ]
+
+    def query(vectorstore):
+        collection_name = vectorstore.collection_name
+        dimension = get_collection_dimension(collection_name)
+        if dimension and dimension != len(vectors[0]):
+            raise ValueError(f"Collection '{collection_name}' has vector size {dimension}, query vectors have {len(vectors[0])}")
+        return vectorstore.client.query_batch_points(collection_name=collection_name, requests=requests)
+
+    def search(collection_name: str):
+        return collection_name, run_on_collection(collection_name, query, create=collection_name == QDRANT_COLLECTION_NAME)
+
+    if len(collection_names) == 1:
+        responses_by_collection = [search(collection_names[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(collection_names)) as pool:
+            responses_by_collection = list(pool.map(search, collection_names))
+
+    results = []
+    for i in range(len(questions)):
+        hits = [
+            (collection_name, point)
+            for collection_name, responses in responses_by_collection
+            for point in responses[i].points
+        ]
+        hits.sort(key=lambda hit: hit[1].score, reverse=True)
+
+        docs = []
+        for collection_name, point in hits[:k]:
+            payload = point.payload or {}
+            metadata = dict(payload.get("metadata") or {})
+            metadata["_id"] = point.id
+            metadata["_score"] = point.score
+            metadata["_collection_name"] = collection_name
+            docs.append(Document(page_content=payload.get("text", ""), metadata=metadata))
+        results.append(docs)
+    return results
+
+async def rag_query_batch(questions: list[str], k: int, concurrency: int = QUERY_BATCH_CONCURRENCY,
+                          query_filter: Optional["models.Filter"] = None,
+                          collection_names: Optional[list[str]] = None) -> list[dict]:
+    """
+    Answers several questions with one batched retrieval and concurrent LLM calls.
+    At most `concurrency` LLM calls are in flight at the same time.
+
+    Returns:
+        One result dict per question, in input order. Failed items carry an
+        "error" message instead of an "answer".
+    """
+    results = [
+        {"question": question, "answer": None, "raw_results": [], "error": None}
+        for question in questions
+    ]
+
+    valid_indexes = []
+    for i, question in enumerate(questions):
+        if question and question.strip():
+            valid_indexes.append(i)
+        else:
+            results[i]["error"] = "Empty question"
+
+    if not valid_indexes:
+        return results
+
+    retrieved = await asyncio.to_thread(
+        batch_similarity_search, [questions[i] for i in valid_indexes], k, query_filter, collection_names
+    )
+
+    llm = get_llm_query()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def answer(index: int, chunks: list["Document"]):
+        results[index]["raw_results"] = [doc.page_content for doc in chunks]
+        async with semaphore:
+            try:
+                results[index]["answer"] = await arag_query(questions[index], chunks, llm=llm)
+            except Exception as e:
+                logger.error(f"LLM invocation failed for batch question {index}: {e}", exc_info=True)
+                results[index]["error"] = f"LLM answer generation failed: {e}"
+
+    await asyncio.gather(*(answer(i, chunks) for i, chunks in zip(valid_indexes, retrieved)))
+    return results
+
 def analyze_file_content(content: str, filename: str) -> str:
     """
     Analyzes the content of a single file using the LLM.
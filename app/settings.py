@@ -15,4 +15,36 @@ MISTRAL_EMBEDDINGS_MODEL = os.getenv("MISTRAL_EMBEDDING_MODEL", "mistral-embed")
 # Qdrant Configuration
 QDRANT_HOST = os.getenv("QDRANT_HOST", "127.0.0.1")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
-QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "document_collection")
\ No newline at end of file
+QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "document_collection")
+QDRANT_SHARD_NUMBER = int(os.getenv("QDRANT_SHARD_NUMBER", 1))
+QDRANT_REPLICATION_FACTOR = int(os.getenv("QDRANT_REPLICATION_FACTOR", 1))
+QDRANT_COLLECTION_PER_REPO = os.getenv("QDRANT_COLLECTION_PER_REPO", "false").lower() == "true"
+
+# Batch query Configuration
+QUERY_BATCH_MAX_QUESTIONS = int(os.getenv("QUERY_BATCH_MAX_QUESTIONS", 500))
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", 8))
+QUERY_FANOUT_MAX_COLLECTIONS = int(os.getenv("QUERY_FANOUT_MAX_COLLECTIONS", 16))
+
+# Ingest deduplication Configuration
+DEDUP_NEAR_DUPLICATES = os.getenv("DEDUP_NEAR_DUPLICATES", "true").lower() == "true"
+DEDUP_SIMILARITY_THRESHOLD = float(os.getenv("DEDUP_SIMILARITY_THRESHOLD", 0.9))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", 128))
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", 5))
+DEDUP_INDEX_DIR = os.getenv("DEDUP_INDEX_DIR", "dedup_index")
+
+# Snapshot Configuration
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", 256))
+SNAPSHOT_IMPORT_PARALLEL = int(os.getenv("SNAPSHOT_IMPORT_PARALLEL", 4))
+
+# Startup Configuration
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+# Upload Configuration
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 100 * 1024 * 1024))
+UPLOAD_SNIFF_BYTES = int(os.getenv("UPLOAD_SNIFF_BYTES", 8192))
+UPLOAD_DEFERRED_MAX_BYTES = int(os.getenv("UPLOAD_DEFERRED_MAX_BYTES", 1024 * 1024))
+
+# Repository source chunk Configuration
+CODE_CHUNK_MAX_CHARS = int(os.getenv("CODE_CHUNK_MAX_CHARS", 1500))
+CODE_EMBED_BATCH_SIZE = int(os.getenv("CODE_EMBED_BATCH_SIZE", 64))
\ No newline at end of file
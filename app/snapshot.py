@@ -0,0 +1,329 @@
+# app/snapshot.py
+# This file handles exporting and importing Qdrant collections for fast warm starts.
+# Author: Yassine Amounane
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional, TYPE_CHECKING
+from app.core import get_qdrant_client, invalidate_vectorstore, resolve_collection_name
+from app.settings import (
+    QDRANT_HOST,
+    QDRANT_PORT,
+    QDRANT_COLLECTION_NAME,
+    QDRANT_SHARD_NUMBER,
+    QDRANT_REPLICATION_FACTOR,
+    SNAPSHOT_BATCH_SIZE,
+    SNAPSHOT_IMPORT_PARALLEL
+)
+from app.utils.dedup import get_signature_index, reset_signature_index
+
+if TYPE_CHECKING:
+    import numpy as np
+    from qdrant_client import models
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+PAYLOADS_FILE = "payloads.jsonl"
+SIGNATURES_FILE = "signatures.jsonl"
+
+class SnapshotNotFoundError(Exception):
+    pass
+
+def _snapshot_location(collection_name: str, snapshot_name: str) -> str:
+    return f"http://{QDRANT_HOST}:{QDRANT_PORT}/collections/{collection_name}/snapshots/{snapshot_name}"
+
+def _collection_vector_params(client, collection_name: str) -> "models.VectorParams":
+    from qdrant_client import models
+
+    info = client.get_collection(collection_name=collection_name)
+    vectors = info.config.params.vectors
+    if not isinstance(vectors, models.VectorParams):
+        raise ValueError(f"Collection '{collection_name}' uses named vectors, which are not supported for export")
+    return vectors
+
+def _quantize_int8(batch: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    """Symmetric per-vector int8 quantization. Returns (codes, scales)."""
+    import numpy as np
+
+    scales = np.abs(batch).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(batch / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _write_snapshot(path: str, collection_name: str, quantize: bool, batch_size: int) -> dict:
+    import numpy as np
+
+    client = get_qdrant_client()
+    vector_params = _collection_vector_params(client, collection_name)
+    total = client.count(collection_name=collection_name, exact=True).count
+    dtype = np.int8 if quantize else np.float32
+
+    logger.info(f"Exporting {total} points from collection '{collection_name}' ({np.dtype(dtype).name})")
+
+    vectors = np.lib.format.open_memmap(
+        os.path.join(path, VECTORS_FILE), mode="w+", dtype=dtype, shape=(total, vector_params.size)
+    )
+    scales = np.ones(total, dtype=np.float32)
+
+    written = 0
+    offset = None
+    with open(os.path.join(path, PAYLOADS_FILE), "w", encoding="utf-8") as payloads_file:
+        while written < total:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=min(batch_size, total - written),
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            if not points:
+                break
+
+            batch = np.asarray([point.vector for point in points], dtype=np.float32)
+            end = written + len(points)
+            if quantize:
+                vectors[written:end], scales[written:end] = _quantize_int8(batch)
+            else:
+                vectors[written:end] = batch
+
+            for point in points:
+                payload = point.payload or {}
+                payloads_file.write(json.dumps({"id": point.id, "text": payload.get("text"), "metadata": payload.get("metadata")}) + "\n")
+
+            written = end
+            if offset is None:
+                break
+
+    vectors.flush()
+    del vectors
+    if quantize:
+        np.save(os.path.join(path, SCALES_FILE), scales[:written])
+
+    get_signature_index(collection_name).write_to(os.path.join(path, SIGNATURES_FILE))
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "collection_name": collection_name,
+        "count": written,
+        "vector_size": vector_params.size,
+        "distance": vector_params.distance.value if hasattr(vector_params.distance, "value") else str(vector_params.distance),
+        "dtype": np.dtype(dtype).name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def export_collection(path: str, collection_name: str = QDRANT_COLLECTION_NAME, quantize: bool = False,
+                      batch_size: int = SNAPSHOT_BATCH_SIZE) -> dict:
+    """
+    Exports all vectors and payloads of a collection to a local directory.
+
+    Vectors are written to a contiguous .npy array (float32, or int8 with
+    per-vector scales when quantize is set) that can be memory-mapped on
+    import. Payloads are streamed to a JSON lines sidecar, one point per line
+    in the same order as the vectors, so neither side holds them all in memory.
+
+    The snapshot is written to a temporary sibling directory and moved into
+    place once complete, so a failed export never leaves an existing snapshot
+    with mismatched files.
+
+    Returns:
+        The snapshot manifest.
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(os.path.abspath(path))}.", dir=parent)
+
+    try:
+        manifest = _write_snapshot(work_dir, collection_name, quantize, batch_size)
+        if os.path.exists(path):
+            previous = f"{work_dir}.previous"
+            os.replace(path, previous)
+            os.replace(work_dir, path)
+            shutil.rmtree(previous, ignore_errors=True)
+        else:
+            os.replace(work_dir, path)
+    except Exception:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    logger.info(f"Exported {manifest['count']} points from collection '{collection_name}' to {path}")
+    return manifest
+
+def _snapshot_points(path: str, vectors: "np.ndarray", scales: Optional["np.ndarray"], batch_size: int):
+    """
+    Yields the points of a snapshot, reading batch_size payload lines at a time
+    next to the matching slice of the memory-mapped vectors.
+    """
+    import numpy as np
+    from qdrant_client import models
+
+    with open(os.path.join(path, PAYLOADS_FILE), "r", encoding="utf-8") as f:
+        for start in range(0, len(vectors), batch_size):
+            batch = vectors[start:start + batch_size].astype(np.float32)
+            if scales is not None:
+                batch *= scales[start:start + batch_size, None]
+
+            for vector in batch:
+                line = f.readline()
+                if not line:
+                    raise ValueError(f"Snapshot {path} has fewer payloads than vectors")
+                entry = json.loads(line)
+                yield models.PointStruct(
+                    id=entry["id"],
+                    vector=vector.tolist(),
+                    payload={"text": entry["text"], "metadata": entry["metadata"]}
+                )
+
+def import_collection(path: str, collection_name: Optional[str] = None, recreate: bool = False,
+                      batch_size: int = SNAPSHOT_BATCH_SIZE, parallel: int = SNAPSHOT_IMPORT_PARALLEL) -> dict:
+    """
+    Bulk-loads a snapshot written by export_collection into a collection.
+    Vectors are read through a memory map and payloads are streamed from the
+    sidecar; points are uploaded in parallel batches.
+
+    Args:
+        path: The snapshot directory.
+        collection_name: Target collection. Defaults to the exported collection name.
+        recreate: Drop the target collection first if it exists.
+
+    Returns:
+        The snapshot manifest, with the target collection name.
+    """
+    import numpy as np
+    from qdrant_client import models
+
+    with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+
+    collection_name = collection_name or manifest["collection_name"]
+    count = manifest["count"]
+    vector_size = manifest["vector_size"]
+
+    vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")[:count]
+
+    client = get_qdrant_client()
+    exists = client.collection_exists(collection_name=collection_name)
+    if exists and recreate:
+        client.delete_collection(collection_name=collection_name)
+        invalidate_vectorstore(collection_name)
+        get_signature_index(collection_name).reset()
+        exists = False
+    if exists:
+        existing_size = _collection_vector_params(client, collection_name).size
+        if existing_size != vector_size:
+            raise ValueError(f"Collection '{collection_name}' has vector size {existing_size}, snapshot has {vector_size}")
+    else:
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(size=vector_size, distance=models.Distance(manifest["distance"])),
+            shard_number=QDRANT_SHARD_NUMBER,
+            replication_factor=QDRANT_REPLICATION_FACTOR
+        )
+        logger.info(f"Collection '{collection_name}' created with vector size {vector_size}.")
+
+    scales = np.load(os.path.join(path, SCALES_FILE), mmap_mode="r") if manifest["dtype"] == "int8" else None
+
+    logger.info(f"Importing {count} points into collection '{collection_name}' (parallel={parallel}, batch_size={batch_size})")
+    client.upload_points(
+        collection_name=collection_name,
+        points=_snapshot_points(path, vectors, scales, batch_size),
+        batch_size=batch_size,
+        parallel=parallel,
+        wait=True
+    )
+
+    signatures_path = os.path.join(path, SIGNATURES_FILE)
+    if os.path.exists(signatures_path):
+        signature_index = get_signature_index(collection_name)
+        entries = []
+        with open(signatures_path, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                entries.append((entry["key"], entry["sig"]))
+                if len(entries) >= batch_size:
+                    signature_index.add_many(entries)
+                    entries = []
+        signature_index.add_many(entries)
+
+    logger.info(f"Imported {count} points into collection '{collection_name}' from {path}")
+    return {**manifest, "collection_name": collection_name}
+
+def create_qdrant_snapshot(collection_name: str = QDRANT_COLLECTION_NAME) -> dict:
+    """
+    Creates a native Qdrant snapshot of a collection on the Qdrant server.
+
+    Returns:
+        The snapshot name and the URL it can be downloaded or recovered from.
+    """
+    client = get_qdrant_client()
+    snapshot = client.create_snapshot(collection_name=collection_name, wait=True)
+    location = _snapshot_location(collection_name, snapshot.name)
+    logger.info(f"Created Qdrant snapshot '{snapshot.name}' for collection '{collection_name}'")
+    return {"name": snapshot.name, "size": snapshot.size, "location": location}
+
+def list_qdrant_snapshots(collection_name: str = QDRANT_COLLECTION_NAME) -> list[dict]:
+    client = get_qdrant_client()
+    return [
+        {"name": snapshot.name, "size": snapshot.size, "creation_time": snapshot.creation_time}
+        for snapshot in client.list_snapshots(collection_name=collection_name)
+    ]
+
+def recover_qdrant_snapshot(snapshot_name: str, collection_name: str = QDRANT_COLLECTION_NAME):
+    """
+    Restores a collection from one of its native Qdrant snapshots.
+    Only snapshots listed by Qdrant for the collection are accepted, and the
+    location is built from the Qdrant host, so callers cannot make the Qdrant
+    server fetch arbitrary URLs or local paths.
+
+    Raises:
+        SnapshotNotFoundError: If the collection has no snapshot with this name.
+    """
+    if snapshot_name not in {snapshot["name"] for snapshot in list_qdrant_snapshots(collection_name)}:
+        raise SnapshotNotFoundError(f"Snapshot '{snapshot_name}' not found for collection '{collection_name}'")
+
+    location = _snapshot_location(collection_name, snapshot_name)
+    client = get_qdrant_client()
+    client.recover_snapshot(collection_name=collection_name, location=location, wait=True)
+    invalidate_vectorstore(collection_name)
+    # The local signatures describe the points that were just replaced.
+    reset_signature_index(collection_name)
+    logger.info(f"Recovered collection '{collection_name}' from snapshot {location}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Export or import a Qdrant collection snapshot.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export a collection to a local directory")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--collection", default=None, help="Routing key or collection name (default collection if omitted)")
+    export_parser.add_argument("--quantize", action="store_true", help="Store vectors as int8 instead of float32")
+
+    import_parser = subparsers.add_parser("import", help="Import a collection from a local directory")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--collection", default=None, help="Routing key or collection name (exported collection if omitted)")
+    import_parser.add_argument("--recreate", action="store_true", help="Drop the target collection first")
+    import_parser.add_argument("--parallel", type=int, default=SNAPSHOT_IMPORT_PARALLEL)
+
+    args = parser.parse_args()
+    start = time.perf_counter()
+    if args.command == "export":
+        result = export_collection(args.path, collection_name=resolve_collection_name(args.collection), quantize=args.quantize)
+    else:
+        collection_name = resolve_collection_name(args.collection) if args.collection else None
+        result = import_collection(args.path, collection_name=collection_name, recreate=args.recreate, parallel=args.parallel)
+    print(json.dumps(result, indent=2))
+    print(f"Done in {time.perf_counter() - start:.1f}s")
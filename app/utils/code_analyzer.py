@@ -21,16 +21,62 @@ def detect_language(file_path: str) -> str:
     _, ext = os.path.splitext(file_path)
     return LANGUAGE_EXTENSIONS_MAP.get(ext.lower(), "unknown")
 
+PYTHON_CLASS_PATTERN = re.compile(r"^([ \t]*)class\s+(\w+)(?:\(|:)", re.MULTILINE)
+PYTHON_FUNCTION_PATTERN = re.compile(r"^([ \t]*)(?:async\s+)?def\s+(\w+)\s*\(", re.MULTILINE)
+
+def _python_symbols(file_content: str) -> tuple[list[dict], list[dict]]:
+    """
+    Finds Python classes and functions with their line ranges (1-based, inclusive).
+    A symbol ends before the next statement at the same or a lower indentation
+    (closing brackets of a multi-line signature do not count).
+    Decorator lines directly above a symbol are included in its range.
+    """
+    lines = file_content.splitlines()
+
+    found = []
+    for kind, pattern in (("class", PYTHON_CLASS_PATTERN), ("function", PYTHON_FUNCTION_PATTERN)):
+        for m in pattern.finditer(file_content):
+            line = file_content.count("\n", 0, m.start(2)) + 1
+            found.append({"kind": kind, "name": m.group(2), "indent": len(m.group(1).expandtabs()), "line": line})
+    found.sort(key=lambda symbol: symbol["line"])
+
+    classes, functions = [], []
+    for symbol in found:
+        start_line = symbol["line"]
+        while start_line > 1 and lines[start_line - 2].strip().startswith("@"):
+            start_line -= 1
+
+        end_line = len(lines)
+        for line_number in range(symbol["line"] + 1, len(lines) + 1):
+            text = lines[line_number - 1]
+            stripped = text.strip()
+            if not stripped or stripped.startswith("#") or stripped[0] in ")]}":
+                continue
+            expanded = text.expandtabs()
+            if len(expanded) - len(expanded.lstrip()) <= symbol["indent"]:
+                end_line = line_number - 1
+                break
+        while end_line > start_line and not lines[end_line - 1].strip():
+            end_line -= 1
+
+        entity = {"name": symbol["name"], "start_line": start_line, "end_line": end_line, "indent": symbol["indent"]}
+        if symbol["kind"] == "class":
+            entity["methods"] = []
+            classes.append(entity)
+        else:
+            functions.append(entity)
+
+    return classes, functions
+
 def parse_code(file_content: str, language: str, file_path: str) -> dict:
     """
     Parses code to extract basic entities. Simplified version.
-    For Python, it attempts to find classes and functions using regex.
+    For Python, it attempts to find classes and functions (with line ranges) using regex.
     For other languages, it currently returns a raw content snippet.
     """
     if language == "python":
         try:
-            classes = [{"name": m.group(1), "methods": []} for m in re.finditer(r"^\s*class\s+(\w+)(?:\(|:)", file_content, re.MULTILINE)]
-            functions = [{"name": m.group(1)} for m in re.finditer(r"^\s*def\s+(\w+)\s*\(", file_content, re.MULTILINE)]
+            classes, functions = _python_symbols(file_content)
             imports = [{"name": m.group(1)} for m in re.finditer(r"^\s*import\s+([\w.]+)", file_content, re.MULTILINE)]
             imports.extend([{"name": m.group(1)} for m in re.finditer(r"^\s*from\s+([\w.]+)\s+import", file_content, re.MULTILINE)])
 
@@ -41,6 +87,100 @@ def parse_code(file_content: str, language: str, file_path: str) -> dict:
     else:
         return {"entities": {}, "dependencies": [], "imports": [], "raw_content": file_content[:2000]}
 
+def _line_windows(lines: list[str], first_line: int, max_chars: int):
+    """
+    Splits lines into consecutive windows of at most max_chars.
+    A line longer than max_chars (e.g. minified code) is hard-split into
+    windows of its own that all start on that line.
+    """
+    window, window_start, size = [], first_line, 0
+    for offset, line in enumerate(lines):
+        line_number = first_line + offset
+        if window and size + len(line) + 1 > max_chars:
+            yield window_start, window
+            window, size = [], 0
+        if len(line) > max_chars:
+            for start in range(0, len(line), max_chars):
+                yield line_number, [line[start:start + max_chars]]
+            continue
+        if not window:
+            window_start = line_number
+        window.append(line)
+        size += len(line) + 1
+    if window:
+        yield window_start, window
+
+def chunk_code(file_content: str, language: str, parsed_data: dict, max_chars: int = 1500) -> list[dict]:
+    """
+    Splits a source file into chunks at function and class boundaries.
+
+    Uses the line ranges from parse_code: each line belongs to the innermost
+    symbol that contains it (or to the module), and consecutive lines with the
+    same owner form a chunk. Methods are named "Class.method". Chunks larger
+    than max_chars are split into line windows. Files without symbol line
+    ranges (non-Python) are split into line windows only.
+
+    Returns:
+        A list of dicts with "text", "symbol", "symbol_type", "start_line" and "end_line".
+    """
+    lines = file_content.splitlines()
+    if not lines:
+        return []
+
+    entities = parsed_data.get("entities", {})
+    symbols = [
+        {**entity, "symbol_type": kind}
+        for kind, key in (("class", "classes"), ("function", "functions"))
+        for entity in entities.get(key, [])
+        if "start_line" in entity
+    ]
+    symbols.sort(key=lambda symbol: (symbol["start_line"], -symbol["end_line"]))
+
+    for symbol in symbols:
+        parents = [
+            other for other in symbols
+            if other is not symbol and other["symbol_type"] == "class"
+            and other["start_line"] < symbol["start_line"] and symbol["end_line"] <= other["end_line"]
+            and other["indent"] < symbol["indent"]
+        ]
+        symbol["qualname"] = ".".join([parent["name"] for parent in parents] + [symbol["name"]])
+        if symbol["symbol_type"] == "function" and parents:
+            symbol["symbol_type"] = "method"
+
+    # Symbols are sorted by start line, so a later match is always the innermost one.
+    owners = [None] * len(lines)
+    for index, symbol in enumerate(symbols):
+        for line_number in range(symbol["start_line"], symbol["end_line"] + 1):
+            owners[line_number - 1] = index
+
+    runs = []
+    run_start = 0
+    for i in range(1, len(lines) + 1):
+        if i == len(lines) or owners[i] != owners[run_start]:
+            runs.append((owners[run_start], run_start + 1, lines[run_start:i]))
+            run_start = i
+
+    chunks = []
+    for owner, first_line, run_lines in runs:
+        symbol = symbols[owner] if owner is not None else None
+        for window_start, window in _line_windows(run_lines, first_line, max_chars):
+            while window and not window[0].strip():
+                window = window[1:]
+                window_start += 1
+            while window and not window[-1].strip():
+                window = window[:-1]
+            if not window:
+                continue
+            text = "\n".join(window)
+            chunks.append({
+                "text": text,
+                "symbol": symbol["qualname"] if symbol else None,
+                "symbol_type": symbol["symbol_type"] if symbol else "module",
+                "start_line": window_start,
+                "end_line": window_start + len(window) - 1,
+            })
+    return chunks
+
 def calculate_metrics(file_content: str, language: str, parsed_data: dict) -> dict:
     """Calculates basic code metrics."""
     lines_of_code = len(file_content.splitlines())
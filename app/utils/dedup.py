@@ -0,0 +1,252 @@
+# app/utils/dedup.py
+# This file provides chunk deduplication: exact content hashing and MinHash/LSH near-duplicate detection.
+# Author: Yassine Amounane
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import uuid
+from typing import Optional, TYPE_CHECKING
+from app.settings import DEDUP_INDEX_DIR, DEDUP_NUM_PERM, DEDUP_SHINGLE_SIZE, DEDUP_SIMILARITY_THRESHOLD
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Fixed namespace so the same chunk content always maps to the same Qdrant point ID.
+POINT_ID_NAMESPACE = uuid.UUID("6f1c1d4e-3b7a-5e42-9a8e-2f0d9c61b7a3")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_LOW_29_BITS = (1 << 29) - 1
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def content_hash(text: str) -> str:
+    """Returns the SHA-256 hex digest of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+def point_id_for(digest: str) -> str:
+    """Returns a deterministic Qdrant point ID (UUID) for a content hash."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, digest))
+
+def _shingles(text: str, size: int) -> set[str]:
+    words = normalize_text(text).split(" ")
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _optimal_bands(threshold: float, num_perm: int) -> tuple[int, int]:
+    """
+    Picks the (bands, rows) split whose LSH threshold (1/b)^(1/r) is closest
+    to the requested similarity threshold.
+    """
+    best = (num_perm, 1)
+    best_gap = float("inf")
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        gap = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if gap < best_gap:
+            best, best_gap = (bands, rows), gap
+    return best
+
+class MinHasher:
+    """
+    Computes MinHash signatures over word shingles.
+    All permutations are applied at once with numpy on a uint64 array of shingle hashes.
+    """
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, shingle_size: int = DEDUP_SHINGLE_SIZE, seed: int = 1):
+        import numpy as np
+
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        perms = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        # a is split into 32-bit halves so that a * h never overflows uint64.
+        self._a_high = np.array([a >> 32 for a, _ in perms], dtype=np.uint64)[:, None]
+        self._a_low = np.array([a & _MAX_HASH for a, _ in perms], dtype=np.uint64)[:, None]
+        self._b = np.array([b for _, b in perms], dtype=np.uint64)[:, None]
+
+    def _permute(self, hashes: "np.ndarray") -> "np.ndarray":
+        """Returns ((a * h + b) mod p) & 0xffffffff for every permutation (rows) and hash (columns)."""
+        import numpy as np
+
+        prime = np.uint64(_MERSENNE_PRIME)
+        low = (self._a_low * hashes) % prime
+        # a_high * h * 2^32 mod p, using 2^61 = 1 (mod p): split the product at bit 29.
+        high = self._a_high * hashes
+        high = (((high & np.uint64(_LOW_29_BITS)) << np.uint64(32)) + (high >> np.uint64(29))) % prime
+        return ((low + high + self._b) % prime) & np.uint64(_MAX_HASH)
+
+    def signature(self, text: str) -> list[int]:
+        import numpy as np
+
+        hashes = np.fromiter(
+            (
+                int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "big")
+                for shingle in _shingles(text, self.shingle_size)
+            ),
+            dtype=np.uint64
+        )
+        return self._permute(hashes).min(axis=1).tolist()
+
+def estimate_similarity(sig_a: list[int], sig_b: list[int]) -> float:
+    """Estimates the Jaccard similarity of two MinHash signatures."""
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+class SignatureIndex:
+    """
+    LSH index of MinHash signatures.
+    When a path is given, signatures are persisted there as JSON lines and
+    reloaded on first use. Discarded keys are persisted as tombstone lines.
+    """
+
+    def __init__(self, path: Optional[str] = None, num_perm: int = DEDUP_NUM_PERM,
+                 threshold: float = DEDUP_SIMILARITY_THRESHOLD):
+        self.path = path
+        self.num_perm = num_perm
+        self.threshold = threshold
+        self.bands, self.rows = _optimal_bands(threshold, num_perm)
+        self._signatures: dict[str, list[int]] = {}
+        self._buckets: dict[tuple[int, int], list[str]] = {}
+        self._loaded = path is None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._signatures)
+
+    def _band_keys(self, signature: list[int]):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, hash(tuple(signature[start:start + self.rows]))
+
+    def _insert(self, key: str, signature: list[int]):
+        if key in self._signatures:
+            return
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(key)
+
+    def _remove(self, key: str):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket and key in bucket:
+                bucket.remove(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            logger.warning(f"Skipping corrupt line in signature index {self.path}")
+                            continue
+                        if entry.get("deleted"):
+                            self._remove(entry["key"])
+                        elif len(entry.get("sig", [])) == self.num_perm:
+                            self._insert(entry["key"], entry["sig"])
+                logger.info(f"Loaded {len(self._signatures)} signatures from {self.path}")
+            self._loaded = True
+
+    def find_duplicate(self, signature: list[int]) -> Optional[tuple[str, float]]:
+        """
+        Returns (key, similarity) of the most similar indexed signature at or
+        above the threshold, or None.
+        """
+        self._ensure_loaded()
+        # Candidates are collected under the lock: a concurrent discard() or
+        # reset() may remove keys while another upload is looking them up.
+        with self._lock:
+            candidates = {}
+            for band_key in self._band_keys(signature):
+                for key in self._buckets.get(band_key, ()):
+                    candidate = self._signatures.get(key)
+                    if candidate is not None:
+                        candidates[key] = candidate
+
+        best = None
+        for key, candidate in candidates.items():
+            similarity = estimate_similarity(signature, candidate)
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    def add_many(self, entries: list[tuple[str, list[int]]]):
+        self._ensure_loaded()
+        with self._lock:
+            new_entries = [(key, sig) for key, sig in entries if key not in self._signatures]
+            for key, sig in new_entries:
+                self._insert(key, sig)
+            if self.path and new_entries:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for key, sig in new_entries:
+                        f.write(json.dumps({"key": key, "sig": sig}) + "\n")
+
+    def discard(self, key: str):
+        """Removes a key, e.g. when its point no longer exists in Qdrant."""
+        self._ensure_loaded()
+        with self._lock:
+            if key not in self._signatures:
+                return
+            self._remove(key)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "deleted": True}) + "\n")
+
+    def write_to(self, path: str):
+        """Writes the live signatures (without discarded keys) to a JSON lines file."""
+        self._ensure_loaded()
+        with self._lock:
+            with open(path, "w", encoding="utf-8") as f:
+                for key, sig in self._signatures.items():
+                    f.write(json.dumps({"key": key, "sig": sig}) + "\n")
+
+    def reset(self):
+        with self._lock:
+            self._signatures.clear()
+            self._buckets.clear()
+            if self.path and os.path.exists(self.path):
+                os.unlink(self.path)
+            self._loaded = True
+
+_indexes: dict[str, SignatureIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_signature_index(collection_name: str) -> SignatureIndex:
+    """Returns the local signature index for a Qdrant collection."""
+    with _indexes_lock:
+        if collection_name not in _indexes:
+            path = os.path.join(DEDUP_INDEX_DIR, f"{collection_name}.jsonl")
+            _indexes[collection_name] = SignatureIndex(path=path)
+        return _indexes[collection_name]
+
+def reset_signature_index(collection_name: str):
+    get_signature_index(collection_name).reset()
+    logger.info(f"Signature index for collection '{collection_name}' reset.")
@@ -2,7 +2,6 @@
 # This file contains functions for validating uploaded files.
 # Author: Yassine Amounane
 import logging
-import magic
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -14,7 +13,42 @@ SUPPORTED_MIME_TYPES = {
     "text/plain": ".txt",
 }
 
+# Container types libmagic may report for a supported file when it only sees the
+# first bytes: a .docx is a zip archive, a .doc is an OLE/CDF compound file.
+# The header check keeps sniffing these as more bytes arrive; if the upload ends
+# first, validate_file settles them on the whole file.
+DEFERRED_MIME_TYPES = {"application/zip", "application/x-ole-storage", "application/CDFV2"}
+
+def validate_file_header(head: bytes) -> tuple[bool, str, bool]:
+    """
+    Validates the MIME type from the first bytes of an upload, before the rest arrives.
+
+    Returns:
+        (is_valid, message, deferred): deferred is True when the bytes seen so far
+        are a container that a supported type may be stored in, but the type is
+        not confirmed yet.
+    """
+    import magic
+
+    try:
+        mime = magic.from_buffer(head, mime=True)
+    except magic.MagicException as e:
+        message = f"Magic library error during header validation: {e}"
+        logger.error(message, exc_info=True)
+        return False, message, False
+
+    if mime in SUPPORTED_MIME_TYPES:
+        return True, f"Supported type: {mime} ({SUPPORTED_MIME_TYPES[mime]})", False
+    if mime in DEFERRED_MIME_TYPES:
+        return True, f"Type {mime} to be confirmed", True
+
+    message = f"Unsupported MIME type: {mime}"
+    logger.warning(f"{message} (detected from upload header)")
+    return False, message, False
+
 def validate_file(file_path: str) -> tuple[bool, str]:
+    import magic
+
     try:
         p = Path(file_path)
         if not p.exists():
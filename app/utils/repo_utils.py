@@ -6,8 +6,9 @@ import logging
 import os
 import json
 from app.rag_service import analyze_file_content
-from app.document import add_texts_to_qdrant
-from app.utils.code_analyzer import detect_language, parse_code, calculate_metrics, generate_tags
+from app.document import add_texts_to_qdrant, add_code_chunks_to_index, delete_code_chunks
+from app.settings import CODE_CHUNK_MAX_CHARS, CODE_EMBED_BATCH_SIZE, QDRANT_COLLECTION_NAME
+from app.utils.code_analyzer import detect_language, parse_code, calculate_metrics, generate_tags, chunk_code
 
 SKIPPED_EXTENSIONS = {
     '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp', '.ico', '.svg',
@@ -67,18 +68,11 @@ def clone_repository(repo_url: str, branch: str, path: str) -> bool:
         logger.error(f"An unexpected error occurred during git clone: {e}", exc_info=True)
         return False
 
-def process_repository_files(repo_path: str, repo_name: str) -> dict[str, str]:
+def iter_repository_files(repo_path: str, repo_name: str):
     """
-    Processes all files in a given repository path, reads their content, analyzes it, and logs information.
-
-    Args:
-        repo_path: The local path of the cloned repository.
-        repo_name: The name of the repository (e.g., derived from the URL).
-
-    Returns:
-        A dictionary where keys are relative file paths and values are their analyses.
+    Yields (file_path, relative_file_path, file_content) for every readable,
+    non-skipped file of a repository.
     """
-    analyses: dict[str, str] = {}
     for root, dirs, files in os.walk(repo_path):
         if ".git" in dirs:
             dirs.remove(".git")
@@ -95,7 +89,6 @@ def process_repository_files(repo_path: str, repo_name: str) -> dict[str, str]:
                 logger.info(f"Skipping file due to type/name: {relative_file_path}")
                 continue
 
-            file_content = None
             try:
                 with open(file_path, "r", encoding="utf-8") as f_obj:
                     file_content = f_obj.read()
@@ -103,50 +96,119 @@ def process_repository_files(repo_path: str, repo_name: str) -> dict[str, str]:
                 logger.warning(f"Could not read file {file_path} in repo {repo_name}: {e}. Skipping.", exc_info=True)
                 continue
 
-            language = detect_language(relative_file_path)
-            parsed_data = parse_code(file_content, language, relative_file_path)
-            metrics = calculate_metrics(file_content, language, parsed_data)
-            tags = generate_tags(relative_file_path, language, parsed_data)
+            yield file_path, relative_file_path, file_content
 
-            llm_summary = "Error: LLM summary generation failed."
-            try:
-                llm_summary = analyze_file_content(file_content, relative_file_path)
-            except Exception as e:
-                logger.error(f"LLM analysis (summary) failed for file {relative_file_path} in {repo_name}: {e}", exc_info=True)
-
-            analysis_json_object = {
-                "file_path": relative_file_path,
-                "language": language,
-                "summary": llm_summary,
-                "entities": parsed_data.get("entities", {}),
-                "dependencies": parsed_data.get("dependencies", []),
-                "imports": parsed_data.get("imports", []),
-                "metrics": metrics,
-                "tags": tags,
-                "raw_content_snippet": parsed_data.get("raw_content")             
-            }
-            if "error" in parsed_data:
-                analysis_json_object["parsing_error"] = parsed_data["error"]
-
-            analysis_to_store = json.dumps(analysis_json_object)
-            analyses[relative_file_path] = analysis_to_store
+def process_repository_files(repo_path: str, repo_name: str, collection_name: str = QDRANT_COLLECTION_NAME) -> dict[str, str]:
+    """
+    Processes all files in a given repository path, reads their content, analyzes it, and logs information.
 
-            try:
-                num_added = add_texts_to_qdrant(
-                    texts=[analysis_to_store],
-                    metadatas=[{
-                        "repo_name": repo_name,
-                        "file_path": relative_file_path,
-                        "original_file_path": file_path,
-                        "is_summary": False,
-                        "language": language
-                    }]
-                )
-                if num_added > 0:
-                    logger.info(f"Attempted to store detailed analysis for {relative_file_path} (lang: {language}) from repo {repo_name} in Qdrant.")
-                else:
-                    logger.warning(f"Call to store detailed analysis for {relative_file_path} from repo {repo_name} resulted in 0 texts added.")
-            except Exception as e:
-                logger.error(f"Error storing detailed analysis for {relative_file_path} from repo {repo_name} in Qdrant: {e}", exc_info=True)
+    Args:
+        repo_path: The local path of the cloned repository.
+        repo_name: The name of the repository (e.g., derived from the URL).
+        collection_name: The Qdrant collection the analyses are stored in.
+
+    Returns:
+        A dictionary where keys are relative file paths and values are their analyses.
+    """
+    analyses: dict[str, str] = {}
+    for file_path, relative_file_path, file_content in iter_repository_files(repo_path, repo_name):
+        language = detect_language(relative_file_path)
+        parsed_data = parse_code(file_content, language, relative_file_path)
+        metrics = calculate_metrics(file_content, language, parsed_data)
+        tags = generate_tags(relative_file_path, language, parsed_data)
+
+        llm_summary = "Error: LLM summary generation failed."
+        try:
+            llm_summary = analyze_file_content(file_content, relative_file_path)
+        except Exception as e:
+            logger.error(f"LLM analysis (summary) failed for file {relative_file_path} in {repo_name}: {e}", exc_info=True)
+
+        analysis_json_object = {
+            "file_path": relative_file_path,
+            "language": language,
+            "summary": llm_summary,
+            "entities": parsed_data.get("entities", {}),
+            "dependencies": parsed_data.get("dependencies", []),
+            "imports": parsed_data.get("imports", []),
+            "metrics": metrics,
+            "tags": tags,
+            "raw_content_snippet": parsed_data.get("raw_content")             
+        }
+        if "error" in parsed_data:
+            analysis_json_object["parsing_error"] = parsed_data["error"]
+
+        analysis_to_store = json.dumps(analysis_json_object)
+        analyses[relative_file_path] = analysis_to_store
+
+        try:
+            num_added = add_texts_to_qdrant(
+                texts=[analysis_to_store],
+                metadatas=[{
+                    "repo_name": repo_name,
+                    "file_path": relative_file_path,
+                    "original_file_path": file_path,
+                    "is_summary": False,
+                    "language": language
+                }],
+                collection_name=collection_name
+            )
+            if num_added > 0:
+                logger.info(f"Attempted to store detailed analysis for {relative_file_path} (lang: {language}) from repo {repo_name} in Qdrant.")
+            else:
+                logger.warning(f"Call to store detailed analysis for {relative_file_path} from repo {repo_name} resulted in 0 texts added.")
+        except Exception as e:
+            logger.error(f"Error storing detailed analysis for {relative_file_path} from repo {repo_name} in Qdrant: {e}", exc_info=True)
 
     return analyses
+
+def index_repository_source(repo_path: str, repo_name: str, batch_size: int = CODE_EMBED_BATCH_SIZE,
+                            collection_name: str = QDRANT_COLLECTION_NAME) -> int:
+    """
+    Splits the source files of a repository at function and class boundaries
+    and stores the chunks in Qdrant, replacing the repository's previous chunks.
+
+    Each chunk carries repo_name, file_path, language, symbol, symbol_type and
+    start_line/end_line in its metadata so /query can filter on them.
+
+    Returns:
+        The number of source chunks stored.
+    """
+    try:
+        delete_code_chunks(repo_name, collection_name=collection_name)
+    except Exception as e:
+        logger.warning(f"Could not delete previous source chunks of {repo_name}: {e}")
+
+    total_added = 0
+    pending = []
+    for _, relative_file_path, file_content in iter_repository_files(repo_path, repo_name):
+        language = detect_language(relative_file_path)
+        if language == "unknown":
+            continue
+
+        parsed_data = parse_code(file_content, language, relative_file_path)
+        for chunk in chunk_code(file_content, language, parsed_data, max_chars=CODE_CHUNK_MAX_CHARS):
+            header = f"# {relative_file_path}:{chunk['start_line']}-{chunk['end_line']}"
+            if chunk["symbol"]:
+                header += f" ({chunk['symbol_type']} {chunk['symbol']})"
+            pending.append({
+                "text": f"{header}\n{chunk['text']}",
+                "metadata": {
+                    "repo_name": repo_name,
+                    "file_path": relative_file_path,
+                    "language": language,
+                    "symbol": chunk["symbol"],
+                    "symbol_type": chunk["symbol_type"],
+                    "start_line": chunk["start_line"],
+                    "end_line": chunk["end_line"],
+                    "is_code_chunk": True,
+                    "is_summary": False
+                }
+            })
+
+        if len(pending) >= batch_size:
+            total_added += add_code_chunks_to_index(pending, batch_size=batch_size, collection_name=collection_name)
+            pending = []
+
+    total_added += add_code_chunks_to_index(pending, batch_size=batch_size, collection_name=collection_name)
+    logger.info(f"Indexed {total_added} source chunks for repository {repo_name}")
+    return total_added
@@ -0,0 +1,193 @@
+# app/utils/upload_stream.py
+# This file streams multipart uploads to disk with early validation and size limits.
+# Author: Yassine Amounane
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import Request
+from app.settings import MAX_UPLOAD_SIZE, UPLOAD_DEFERRED_MAX_BYTES, UPLOAD_SNIFF_BYTES
+from app.utils.file_validation import validate_file_header
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Allowance for multipart boundaries and part headers when checking Content-Length.
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+@dataclass
+class StreamedUpload:
+    filename: str
+    path: str
+    size: int
+    sha256: str
+    validation: str
+
+class _UploadWriter:
+    """
+    Receives the file part of a multipart body chunk by chunk.
+    The first bytes are buffered until the MIME type can be checked; after
+    that, data is hashed and written straight to a temporary file.
+    A container type (zip, OLE) is sniffed again each time the buffer doubles
+    and rejected if it is still unconfirmed after deferred_max_bytes.
+    """
+
+    def __init__(self, max_size: int, sniff_bytes: int, deferred_max_bytes: int):
+        self.max_size = max_size
+        self.sniff_bytes = sniff_bytes
+        self.deferred_max_bytes = max(deferred_max_bytes, sniff_bytes)
+        self.filename: Optional[str] = None
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.validation: Optional[str] = None
+        self.tmpfile = None
+        self._head = bytearray()
+        self._next_check = sniff_bytes
+
+    def open(self, filename: str):
+        self.filename = filename
+        self.tmpfile = tempfile.NamedTemporaryFile(delete=False)
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadRejected(413, f"File too large (max {self.max_size} bytes)")
+
+        self.sha256.update(data)
+        if self.validation is None:
+            self._head.extend(data)
+            if len(self._head) >= self._next_check:
+                self._check_head()
+        else:
+            self.tmpfile.write(data)
+
+    def finish(self):
+        if self.validation is None:
+            self._check_head(final=True)
+
+    def _check_head(self, final: bool = False):
+        if not self._head:
+            raise UploadRejected(400, "Empty file")
+        is_valid, message, deferred = validate_file_header(bytes(self._head))
+        if not is_valid:
+            raise UploadRejected(400, message)
+        if deferred and not final:
+            if len(self._head) >= self.deferred_max_bytes:
+                raise UploadRejected(400, f"Unsupported file: {message} not confirmed within the first {self.deferred_max_bytes} bytes")
+            self._next_check = min(len(self._head) * 2, self.deferred_max_bytes)
+            return
+        self.validation = message
+        self.tmpfile.write(self._head)
+        self._head = bytearray()
+
+    def discard(self):
+        if self.tmpfile is not None:
+            self.tmpfile.close()
+            if os.path.exists(self.tmpfile.name):
+                os.unlink(self.tmpfile.name)
+
+async def receive_upload(request: Request, field_name: str = "file", max_size: int = MAX_UPLOAD_SIZE,
+                         sniff_bytes: int = UPLOAD_SNIFF_BYTES,
+                         deferred_max_bytes: int = UPLOAD_DEFERRED_MAX_BYTES) -> StreamedUpload:
+    """
+    Streams the file field of a multipart/form-data request to a temporary file.
+
+    The upload is rejected as soon as the Content-Length, the running size or
+    the MIME type of the first buffered bytes is known to be unacceptable, so
+    most of a bad body is never read. The SHA-256 of the file is computed
+    while streaming.
+
+    Raises:
+        UploadRejected: With the HTTP status code and message to return.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadRejected(400, "Expected a multipart/form-data request")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise UploadRejected(413, f"File too large (max {max_size} bytes)")
+
+    writer = _UploadWriter(max_size, sniff_bytes, deferred_max_bytes)
+    state = {"header_name": b"", "header_value": b"", "disposition": b"", "in_file": False, "done": False}
+
+    def on_part_begin():
+        state.update({"disposition": b"", "in_file": False})
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["header_name"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        if state["header_name"].lower() == b"content-disposition":
+            state["disposition"] = state["header_value"]
+        state["header_name"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["disposition"])
+        if options.get(b"name", b"").decode("utf-8", "replace") != field_name or state["done"]:
+            return
+        filename = options.get(b"filename", b"").decode("utf-8", "replace")
+        if not filename:
+            raise UploadRejected(400, "File without a name")
+        writer.open(filename)
+        state["in_file"] = True
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["in_file"]:
+            writer.write(data[start:end])
+
+    def on_part_end():
+        if state["in_file"]:
+            writer.finish()
+            state.update({"in_file": False, "done": True})
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except UploadRejected as e:
+        logger.warning(f"Upload rejected after {writer.size} bytes: {e.detail}")
+        writer.discard()
+        raise
+    except Exception as e:
+        writer.discard()
+        raise UploadRejected(400, f"Invalid multipart data: {e}")
+
+    if not state["done"]:
+        writer.discard()
+        raise UploadRejected(400, f"Missing '{field_name}' file field")
+
+    writer.tmpfile.close()
+    return StreamedUpload(
+        filename=writer.filename,
+        path=writer.tmpfile.name,
+        size=writer.size,
+        sha256=writer.sha256.hexdigest(),
+        validation=writer.validation
+    )
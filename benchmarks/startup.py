@@ -0,0 +1,69 @@
+# benchmarks/startup.py
+# Measures application cold start: the time to import main.py in a fresh interpreter,
+# which heavy modules that import pulls in, and optionally the warm-up time.
+# Usage: python benchmarks/startup.py [--runs 5] [--warmup]
+# Author: Yassine Amounane
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = [
+    "langchain_unstructured",
+    "unstructured",
+    "langchain",
+    "langchain_qdrant",
+    "langchain_mistralai",
+    "qdrant_client",
+    "magic",
+    "numpy",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+import_seconds = time.perf_counter() - start
+result = {
+    "import_seconds": import_seconds,
+    "heavy_modules_loaded": [m for m in %(heavy)r if m in sys.modules],
+}
+if %(warmup)r:
+    from app.core import warm_up
+    start = time.perf_counter()
+    state = warm_up()
+    result["warmup_seconds"] = time.perf_counter() - start
+    result["warmup_error"] = state["error"]
+print(json.dumps(result))
+"""
+
+def run_probe(warmup: bool) -> dict:
+    code = PROBE % {"heavy": HEAVY_MODULES, "warmup": warmup}
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark application cold start.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="Also time warm_up() (needs Qdrant and Mistral)")
+    args = parser.parse_args()
+
+    results = [run_probe(args.warmup) for _ in range(args.runs)]
+    import_times = [r["import_seconds"] for r in results]
+
+    print(f"import main: median {statistics.median(import_times):.3f}s, min {min(import_times):.3f}s over {args.runs} runs")
+    print(f"heavy modules loaded at import: {results[-1]['heavy_modules_loaded'] or 'none'}")
+    if args.warmup:
+        warmup_times = [r["warmup_seconds"] for r in results]
+        print(f"warm_up: median {statistics.median(warmup_times):.3f}s")
+        if results[-1]["warmup_error"]:
+            print(f"warm_up error: {results[-1]['warmup_error']}")
+
+if __name__ == "__main__":
+    main()
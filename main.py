@@ -1,6 +1,10 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.api import router
+from app.core import warm_up
+from app.settings import WARMUP_ON_STARTUP
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -8,7 +12,15 @@ load_dotenv()
 
 REACT_HOST = os.getenv("REACT_HOST")
 
-app = FastAPI(title="Silicon Shoring API - AI Agent")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background so the server can answer /health right away;
+    # /ready reports 503 until clients and the collection handle are prepared.
+    if WARMUP_ON_STARTUP:
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+    yield
+
+app = FastAPI(title="Silicon Shoring API - AI Agent", lifespan=lifespan)
 app.include_router(router)
 
 app.add_middleware(
@@ -0,0 +1,31 @@
+# tests/conftest.py
+# Shared fixtures: an in-memory Qdrant client and deterministic fake embeddings.
+# Author: Yassine Amounane
+import pytest
+import app.core as core
+import app.document as document
+import app.rag_service as rag_service
+import app.utils.dedup as dedup
+
+EMBEDDING_DIM = 16
+
+@pytest.fixture
+def qdrant(monkeypatch, tmp_path):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from qdrant_client import QdrantClient
+
+    client = QdrantClient(":memory:")
+    embeddings = DeterministicFakeEmbedding(size=EMBEDDING_DIM)
+    monkeypatch.setattr(core, "get_qdrant_client", lambda: client)
+    monkeypatch.setattr(core, "get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(core, "get_embedding_dimension", lambda: EMBEDDING_DIM)
+    monkeypatch.setattr(document, "get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(rag_service, "get_embeddings", lambda: embeddings)
+    monkeypatch.setattr(dedup, "DEDUP_INDEX_DIR", str(tmp_path / "dedup_index"))
+    dedup._indexes.clear()
+    core.invalidate_vectorstore()
+
+    yield client
+
+    dedup._indexes.clear()
+    core.invalidate_vectorstore()
@@ -0,0 +1,100 @@
+# tests/test_code_analyzer.py
+# Tests for Python symbol line ranges and code-aware chunking.
+# Author: Yassine Amounane
+from app.utils.code_analyzer import chunk_code, parse_code
+
+SOURCE = '''import os
+
+
+@decorator
+@other.decorator(arg=1)
+def top_level(a,
+              b):
+    return a + b
+
+
+class Service(Base):
+    """Docstring."""
+
+    timeout = 5
+
+    @property
+    def name(self):
+        return "service"
+
+    async def run(self):
+        # comment at a lower indentation
+        await self.step()
+
+    class Config:
+        debug = True
+
+
+def after():
+    pass
+'''
+
+def _symbols(source: str = SOURCE) -> dict:
+    entities = parse_code(source, "python", "service.py")["entities"]
+    return {entity["name"]: entity for entity in entities["classes"] + entities["functions"]}
+
+def _chunks_by_symbol(source: str = SOURCE, max_chars: int = 1500) -> dict:
+    parsed = parse_code(source, "python", "service.py")
+    return {chunk["symbol"]: chunk for chunk in chunk_code(source, "python", parsed, max_chars)}
+
+def test_decorators_are_included_in_line_range():
+    symbols = _symbols()
+    assert (symbols["top_level"]["start_line"], symbols["top_level"]["end_line"]) == (4, 8)
+    assert (symbols["name"]["start_line"], symbols["name"]["end_line"]) == (16, 18)
+
+def test_class_range_covers_its_methods():
+    symbols = _symbols()
+    assert (symbols["Service"]["start_line"], symbols["Service"]["end_line"]) == (11, 25)
+    assert (symbols["run"]["start_line"], symbols["run"]["end_line"]) == (20, 22)
+    assert (symbols["after"]["start_line"], symbols["after"]["end_line"]) == (28, 29)
+
+def test_methods_get_qualified_names_and_types():
+    chunks = _chunks_by_symbol()
+
+    assert chunks["top_level"]["symbol_type"] == "function"
+    assert chunks["Service.name"]["symbol_type"] == "method"
+    assert chunks["Service.run"]["symbol_type"] == "method"
+    assert chunks["Service.Config"]["symbol_type"] == "class"
+    assert chunks["after"]["symbol_type"] == "function"
+    assert (chunks["Service.name"]["start_line"], chunks["Service.name"]["end_line"]) == (16, 18)
+    assert chunks["Service.name"]["text"].startswith("    @property")
+
+def test_class_body_outside_methods_stays_with_the_class():
+    chunks = _chunks_by_symbol()
+    service = chunks["Service"]
+
+    assert service["symbol_type"] == "class"
+    assert (service["start_line"], service["end_line"]) == (11, 14)
+    assert "timeout = 5" in service["text"]
+    assert "def name" not in service["text"]
+
+def test_module_level_code_has_no_symbol():
+    chunks = _chunks_by_symbol()
+    assert chunks[None]["symbol_type"] == "module"
+    assert chunks[None]["text"] == "import os"
+
+def test_large_symbol_is_split_into_line_windows():
+    body = "\n".join(f"    value_{i} = {i}" for i in range(200))
+    source = f"def big():\n{body}\n"
+    chunks = chunk_code(source, "python", parse_code(source, "python", "big.py"), max_chars=500)
+
+    assert len(chunks) > 1
+    assert all(chunk["symbol"] == "big" and len(chunk["text"]) <= 500 for chunk in chunks)
+    assert chunks[0]["start_line"] == 1
+    assert chunks[-1]["end_line"] == 201
+    assert all(a["end_line"] + 1 == b["start_line"] for a, b in zip(chunks, chunks[1:]))
+
+def test_overlong_line_is_hard_split():
+    minified = "var a=1;" * 1000
+    source = f"// header\n{minified}\nrun();"
+    chunks = chunk_code(source, "javascript", parse_code(source, "javascript", "app.min.js"), max_chars=1500)
+
+    assert all(len(chunk["text"]) <= 1500 for chunk in chunks)
+    assert "".join(chunk["text"] for chunk in chunks if chunk["start_line"] == 2) == minified
+    assert chunks[0]["text"] == "// header"
+    assert chunks[-1]["text"] == "run();" and chunks[-1]["start_line"] == 3
@@ -0,0 +1,75 @@
+# tests/test_collections.py
+# Tests for collection routing keys and multi-collection retrieval.
+# Author: Yassine Amounane
+import math
+import pytest
+from fastapi.testclient import TestClient
+import app.rag_service as rag_service
+from app.core import QDRANT_COLLECTION_NAME, collection_key, get_vectorstore, resolve_collection_name
+from app.rag_service import batch_similarity_search
+from tests.conftest import EMBEDDING_DIM
+
+def _unit_vector(cosine: float) -> list[float]:
+    """A vector whose cosine similarity with the first axis is `cosine`."""
+    return [cosine, math.sqrt(1 - cosine ** 2)] + [0.0] * (EMBEDDING_DIM - 2)
+
+class AxisEmbeddings:
+    def embed_documents(self, texts):
+        return [_unit_vector(1.0) for _ in texts]
+
+@pytest.fixture
+def api_client(qdrant):
+    import main
+    return TestClient(main.app)
+
+def test_routing_key_round_trip():
+    name = resolve_collection_name("acme")
+    assert name == f"{QDRANT_COLLECTION_NAME}__acme"
+    assert collection_key(name) == "acme"
+    assert resolve_collection_name(collection_key(name)) == name
+    assert resolve_collection_name(name) == name
+    assert resolve_collection_name(None) == QDRANT_COLLECTION_NAME
+    assert resolve_collection_name(collection_key(QDRANT_COLLECTION_NAME)) == QDRANT_COLLECTION_NAME
+
+@pytest.mark.parametrize("key", ["bad name", "a/b", f"{QDRANT_COLLECTION_NAME}__bad name", "x" * 65])
+def test_invalid_routing_keys_are_rejected(key):
+    with pytest.raises(ValueError):
+        resolve_collection_name(key)
+
+def test_listed_keys_can_be_sent_back(api_client):
+    get_vectorstore(resolve_collection_name("acme"))
+    get_vectorstore(resolve_collection_name("globex"))
+
+    listed = api_client.get("/collections").json()["collections"]
+    assert set(listed) >= {"acme", "globex"}
+
+    assert api_client.delete("/collection", params={"collection": "acme"}).status_code == 200
+    full_name = resolve_collection_name("globex")
+    assert api_client.delete("/collection", params={"collection": full_name}).status_code == 200
+
+    listed = api_client.get("/collections").json()["collections"]
+    assert "acme" not in listed and "globex" not in listed
+
+def test_deleting_missing_collection_returns_404(api_client):
+    response = api_client.delete("/collection", params={"collection": "missing"})
+    assert response.status_code == 404
+
+def test_hits_from_several_collections_are_merged_by_score(qdrant, monkeypatch):
+    from qdrant_client import models
+
+    monkeypatch.setattr(rag_service, "get_embeddings", lambda: AxisEmbeddings())
+    scores = {"acme": [0.9, 0.5], "globex": [0.8, 0.3]}
+    for key, key_scores in scores.items():
+        name = resolve_collection_name(key)
+        get_vectorstore(name)
+        qdrant.upsert(collection_name=name, points=[
+            models.PointStruct(id=i, vector=_unit_vector(score), payload={"text": f"{key}-{score}", "metadata": {}})
+            for i, score in enumerate(key_scores)
+        ])
+
+    names = [resolve_collection_name(key) for key in scores]
+    results = batch_similarity_search(["question"], 3, collection_names=names)[0]
+
+    assert [doc.page_content for doc in results] == ["acme-0.9", "globex-0.8", "acme-0.5"]
+    assert [doc.metadata["_collection_name"] for doc in results] == [names[0], names[1], names[0]]
+    assert [round(doc.metadata["_score"], 3) for doc in results] == [0.9, 0.8, 0.5]
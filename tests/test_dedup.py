@@ -0,0 +1,116 @@
+# tests/test_dedup.py
+# Tests for MinHash signatures and the LSH signature index.
+# Author: Yassine Amounane
+import hashlib
+import threading
+from app.utils.dedup import (
+    MinHasher,
+    SignatureIndex,
+    _MAX_HASH,
+    _MERSENNE_PRIME,
+    _shingles,
+    content_hash,
+    estimate_similarity,
+    point_id_for,
+)
+
+NUM_PERM = 128
+
+def _words(count: int, prefix: str = "w") -> list[str]:
+    return [f"{prefix}{i}" for i in range(count)]
+
+def _signature_with_changes(base: list[int], changed: int) -> list[int]:
+    """Copies a signature and changes its last `changed` values (so the first LSH bands still match)."""
+    signature = list(base)
+    for i in range(len(signature) - changed, len(signature)):
+        signature[i] += 1_000_000
+    return signature
+
+def test_point_id_is_deterministic_and_ignores_whitespace_and_case():
+    assert point_id_for(content_hash("Hello   World\n")) == point_id_for(content_hash("hello world"))
+    assert point_id_for(content_hash("hello world")) != point_id_for(content_hash("hello there"))
+
+def test_signature_matches_reference_formula():
+    minhasher = MinHasher(num_perm=16, shingle_size=3)
+    text = " ".join(_words(40))
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "big")
+        for shingle in _shingles(text, 3)
+    ]
+    a_values = (minhasher._a_high[:, 0] * (1 << 32) + minhasher._a_low[:, 0]).tolist()
+    expected = [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in zip(a_values, minhasher._b[:, 0].tolist())
+    ]
+    assert minhasher.signature(text) == expected
+
+def test_near_duplicate_found_at_threshold():
+    index = SignatureIndex(num_perm=NUM_PERM, threshold=0.875)
+    base = list(range(NUM_PERM))
+    index.add_many([("stored", base)])
+
+    # 16 of 128 values differ: similarity is exactly 0.875.
+    match = index.find_duplicate(_signature_with_changes(base, 16))
+    assert match == ("stored", 0.875)
+
+def test_near_duplicate_not_found_below_threshold():
+    index = SignatureIndex(num_perm=NUM_PERM, threshold=0.875)
+    base = list(range(NUM_PERM))
+    index.add_many([("stored", base)])
+
+    assert estimate_similarity(base, _signature_with_changes(base, 17)) < 0.875
+    assert index.find_duplicate(_signature_with_changes(base, 17)) is None
+
+def test_near_duplicate_text_detected_and_different_text_not():
+    minhasher = MinHasher(num_perm=NUM_PERM)
+    index = SignatureIndex(num_perm=NUM_PERM, threshold=0.9)
+    words = _words(400)
+    index.add_many([("original", minhasher.signature(" ".join(words)))])
+
+    edited = list(words)
+    edited[200] = "changed"
+    match = index.find_duplicate(minhasher.signature(" ".join(edited)))
+    assert match is not None and match[0] == "original" and match[1] >= 0.9
+
+    # Every tenth word changed: well under the threshold.
+    rewritten = [f"x{i}" if i % 10 == 0 else word for i, word in enumerate(words)]
+    assert index.find_duplicate(minhasher.signature(" ".join(rewritten))) is None
+
+def test_discarded_key_stays_discarded_after_reload(tmp_path):
+    path = str(tmp_path / "collection.jsonl")
+    base = list(range(NUM_PERM))
+    index = SignatureIndex(path=path, num_perm=NUM_PERM)
+    index.add_many([("gone", base), ("kept", [value + 500 for value in base])])
+    index.discard("gone")
+    assert index.find_duplicate(base) is None
+
+    reloaded = SignatureIndex(path=path, num_perm=NUM_PERM)
+    assert len(reloaded) == 1
+    assert reloaded.find_duplicate(base) is None
+    assert reloaded.find_duplicate([value + 500 for value in base])[0] == "kept"
+
+def test_lookup_survives_concurrent_discard_and_reset():
+    index = SignatureIndex(num_perm=NUM_PERM)
+    base = list(range(NUM_PERM))
+    errors = []
+
+    def churn():
+        for i in range(300):
+            index.add_many([(f"key{i}", base)])
+            index.discard(f"key{i}")
+            if i % 50 == 0:
+                index.reset()
+
+    def lookup():
+        try:
+            for _ in range(300):
+                index.find_duplicate(base)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=churn), threading.Thread(target=lookup)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,52 @@
+# tests/test_document.py
+# Tests for document indexing with deduplication and the file hash short-circuit.
+# Author: Yassine Amounane
+import pytest
+import app.document as document
+from app.document import add_documents_to_index, is_file_indexed
+
+PARAGRAPHS = [
+    " ".join(f"alpha{i}" for i in range(400)),
+    " ".join(f"beta{i}" for i in range(400)),
+]
+
+@pytest.fixture
+def fake_loader(monkeypatch):
+    from langchain_core.documents import Document
+
+    contents = {}
+    monkeypatch.setattr(document, "load_documents", lambda paths: [
+        Document(page_content=text, metadata={"source": paths[0]}) for text in contents[paths[0]]
+    ])
+    monkeypatch.setattr(document, "split_documents", lambda docs: docs)
+    return contents
+
+def test_new_file_is_indexed_with_its_hash(qdrant, fake_loader):
+    fake_loader["a.txt"] = PARAGRAPHS
+
+    stats = add_documents_to_index(["a.txt"], {"file_sha256": "hash-a"})
+
+    assert stats["added"] == 2
+    assert is_file_indexed("hash-a")
+    assert not is_file_indexed("hash-unknown")
+
+def test_file_of_exact_duplicates_is_recorded(qdrant, fake_loader):
+    fake_loader["a.txt"] = PARAGRAPHS
+    fake_loader["copy.txt"] = PARAGRAPHS
+    add_documents_to_index(["a.txt"], {"file_sha256": "hash-a"})
+
+    stats = add_documents_to_index(["copy.txt"], {"file_sha256": "hash-copy"})
+
+    assert stats == {"added": 0, "exact_duplicates": 2, "near_duplicates": 0}
+    assert is_file_indexed("hash-copy")
+
+def test_file_of_near_duplicates_is_recorded(qdrant, fake_loader):
+    fake_loader["a.txt"] = PARAGRAPHS
+    fake_loader["edited.txt"] = [text.replace("200 ", "200x ") for text in PARAGRAPHS]
+    add_documents_to_index(["a.txt"], {"file_sha256": "hash-a"})
+
+    stats = add_documents_to_index(["edited.txt"], {"file_sha256": "hash-edited"})
+
+    assert stats == {"added": 0, "exact_duplicates": 0, "near_duplicates": 2}
+    assert is_file_indexed("hash-edited")
+    assert is_file_indexed("hash-a")
@@ -0,0 +1,110 @@
+# tests/test_upload_stream.py
+# Tests for streaming multipart uploads with early validation.
+# Author: Yassine Amounane
+import hashlib
+import io
+import os
+import random
+import zipfile
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+from app.utils.upload_stream import receive_upload, UploadRejected
+
+MAX_SIZE = 64 * 1024
+SNIFF_BYTES = 1024
+DEFERRED_MAX_BYTES = 16 * 1024
+
+def _make_client() -> TestClient:
+    app = FastAPI()
+
+    @app.post("/files")
+    async def upload(request: Request):
+        try:
+            upload = await receive_upload(
+                request, max_size=MAX_SIZE, sniff_bytes=SNIFF_BYTES, deferred_max_bytes=DEFERRED_MAX_BYTES
+            )
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        with open(upload.path, "rb") as f:
+            content = f.read()
+        os.unlink(upload.path)
+        return {"filename": upload.filename, "size": upload.size, "sha256": upload.sha256, "stored_sha256": hashlib.sha256(content).hexdigest()}
+
+    return TestClient(app)
+
+@pytest.fixture
+def client():
+    return _make_client()
+
+def _docx_bytes(padding: int) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        archive.writestr("word/document.xml", "<w:document>" + "x" * padding + "</w:document>")
+    return buffer.getvalue()
+
+def test_text_file_is_streamed_and_hashed(client):
+    content = b"hello world\n" * 2000
+    response = client.post("/files", files={"file": ("notes.txt", content, "text/plain")})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["filename"] == "notes.txt"
+    assert body["size"] == len(content)
+    assert body["sha256"] == body["stored_sha256"] == hashlib.sha256(content).hexdigest()
+
+def test_oversized_upload_returns_413(client):
+    response = client.post("/files", files={"file": ("big.txt", b"x" * (MAX_SIZE + 1), "text/plain")})
+    assert response.status_code == 413
+
+def test_oversized_content_length_returns_413_before_reading(client):
+    response = client.post(
+        "/files",
+        content=b"",
+        headers={"content-type": "multipart/form-data; boundary=x", "content-length": str(MAX_SIZE * 4)},
+    )
+    assert response.status_code == 413
+
+def test_unsupported_type_rejected_from_header(client):
+    gif = b"GIF89a\x01\x00\x01\x00\x00\x00\x00" + b"\0" * (MAX_SIZE // 2)
+    response = client.post("/files", files={"file": ("image.pdf", gif, "application/pdf")})
+
+    assert response.status_code == 400
+    assert "image/gif" in response.json()["detail"]
+
+def test_unidentified_binary_rejected_from_header(client):
+    blob = random.Random(0).randbytes(MAX_SIZE // 2)
+    response = client.post("/files", files={"file": ("blob.docx", blob, "application/octet-stream")})
+
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Unsupported MIME type")
+
+def test_docx_container_accepted(client):
+    response = client.post("/files", files={"file": ("report.docx", _docx_bytes(SNIFF_BYTES * 4), "application/octet-stream")})
+    assert response.status_code == 200
+
+def test_unconfirmed_container_rejected_after_cap(client):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("data.bin", random.Random(1).randbytes(DEFERRED_MAX_BYTES * 2))
+    response = client.post("/files", files={"file": ("archive.docx", buffer.getvalue(), "application/zip")})
+
+    assert response.status_code == 400
+    assert "not confirmed" in response.json()["detail"]
+
+def test_missing_file_field(client):
+    response = client.post("/files", data={"name": "value"}, files={"other": ("notes.txt", b"hello", "text/plain")})
+
+    assert response.status_code == 400
+    assert "'file'" in response.json()["detail"]
+
+def test_empty_file(client):
+    response = client.post("/files", files={"file": ("empty.txt", b"", "text/plain")})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Empty file"
+
+def test_not_multipart(client):
+    response = client.post("/files", json={"file": "notes.txt"})
+    assert response.status_code == 400